@@ -0,0 +1,241 @@
+"""Benchmarks for the read, transform and generation hot paths of wav_file_util.
+
+Synthesizes wav files of different durations, bit depths and channel counts,
+times each operation on them in a fresh process and reports samples/s, MB/s,
+the peak RSS of that process and the peak RSS of the largest worker process it
+started. Results can be saved as a baseline and later runs compared to it, with
+wav_file_util installed (pip install -e .):
+
+    python benchmarks/bench_hot_paths.py --save baseline.json
+    python benchmarks/bench_hot_paths.py --compare baseline.json
+
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import multiprocessing
+import concurrent.futures
+
+import click
+import numpy as np
+
+from wav_file_util.wav_file import WavFile, WavFileMetaData
+from wav_file_util.generation import SineWaveForm
+from wav_file_util.transforms import TransformPipeline, GainStage, remove_left_channel_block
+from wav_file_util import pcm
+from wav_file_util import peaks
+
+
+SAMPLE_RATE = 48000
+
+# The per sample shim calls python once per sample so it only runs on files up to this many frames
+MAX_FRAMES_FOR_PER_SAMPLE = 200000
+
+
+def make_wav_file(filename, duration_seconds, bits_per_sample, num_channels):
+    """Writes a wav file of noise with the given format to filename.
+    """
+    meta_data = WavFileMetaData.make_default(SAMPLE_RATE, bits_per_sample, num_channels, duration_seconds)
+    num_frames = meta_data.data_chunk_size // meta_data.format_chunk_block_align
+    min_value, max_value = pcm.get_sample_value_range(bits_per_sample)
+    rng = np.random.default_rng(0)
+    with open(filename, 'wb') as wav_file_obj:
+        wav_file_obj.write(meta_data.get_bytes())
+        for start_frame in range(0, num_frames, WavFile.SAMPLES_PER_BLOCK):
+            block_num_frames = min(WavFile.SAMPLES_PER_BLOCK, num_frames - start_frame)
+            frames = rng.integers(min_value, max_value, size=(block_num_frames, num_channels), endpoint=True)
+            wav_file_obj.write(pcm.encode_frames(frames, bits_per_sample))
+
+
+def keep_sample(channel_index, sample_value):
+    return sample_value
+
+
+def bench_open_existing(src_filename, dest_filename):
+    WavFile.open_existing(src_filename)
+
+
+def bench_copy(src_filename, dest_filename):
+    WavFile.create_new_wav_file_with_transformation(WavFile.open_existing(src_filename), dest_filename)
+
+
+def bench_transform_block(src_filename, dest_filename):
+    WavFile.create_new_wav_file_with_transformation(WavFile.open_existing(src_filename), dest_filename,
+            block_trans_func=remove_left_channel_block)
+
+
+def bench_transform_per_sample(src_filename, dest_filename):
+    WavFile.create_new_wav_file_with_transformation(WavFile.open_existing(src_filename), dest_filename,
+            trans_func=keep_sample)
+
+
+def bench_transform_parallel(src_filename, dest_filename):
+    WavFile.create_new_wav_file_with_transformation(WavFile.open_existing(src_filename), dest_filename,
+            block_trans_func=remove_left_channel_block, workers=os.cpu_count())
+
+
+def bench_pipeline(src_filename, dest_filename):
+    pipeline = TransformPipeline([GainStage(-6.0), remove_left_channel_block])
+    WavFile.create_new_wav_file_with_transformation(WavFile.open_existing(src_filename), dest_filename,
+            block_trans_func=pipeline)
+
+
+def bench_resample(src_filename, dest_filename):
+    WavFile.create_new_wav_file_with_conversion(WavFile.open_existing(src_filename), dest_filename, sample_rate=44100)
+
+
+def bench_frames_read(src_filename, dest_filename):
+    with WavFile.open_existing(src_filename) as wav_file:
+        frames = wav_file.frames
+        for start_frame in range(0, len(frames), WavFile.SAMPLES_PER_BLOCK):
+            frames[start_frame:start_frame + WavFile.SAMPLES_PER_BLOCK]
+
+
+def bench_analyze(src_filename, dest_filename):
+    WavFile.open_existing(src_filename).analyze()
+
+
+def bench_peaks(src_filename, dest_filename):
+    peaks.update_peak_file(src_filename, force=True)
+
+
+def bench_wave_form(dest_filename, duration_seconds, bits_per_sample, num_channels):
+    WavFile.create_new_wav_file_with_wave_form(dest_filename, SineWaveForm(440), sample_rate=SAMPLE_RATE,
+            bits_per_sample=bits_per_sample, num_channels=num_channels, duration_seconds=duration_seconds)
+
+
+# name: (function, whether it runs on each synthesized file or generates a file of each format itself)
+benchmarks_by_name = {
+    'open_existing': (bench_open_existing, True),
+    'copy': (bench_copy, True),
+    'transform_block': (bench_transform_block, True),
+    'transform_per_sample': (bench_transform_per_sample, True),
+    'transform_parallel': (bench_transform_parallel, True),
+    'pipeline': (bench_pipeline, True),
+    'resample': (bench_resample, True),
+    'frames_read': (bench_frames_read, True),
+    'analyze': (bench_analyze, True),
+    'peaks': (bench_peaks, True),
+    'wave_form': (bench_wave_form, False)
+}
+
+
+def run_case(benchmark_name, src_filename, dest_filename, case_format, repeat):
+    """Runs in a fresh worker process so peak RSS only covers this case. Returns
+    the best time of repeat runs, the peak RSS in bytes of this process and the
+    peak RSS in bytes of the largest process it started and waited for, such as
+    the workers of transform_parallel, which is 0 if it started none.
+    case_format is the (duration_seconds, bits_per_sample, num_channels) of the
+    case, which is what generation benchmarks are given instead of src_filename.
+    """
+    func, reads_src_file = benchmarks_by_name[benchmark_name]
+    args = (src_filename, dest_filename) if reads_src_file else (dest_filename,) + case_format
+    best_seconds = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func(*args)
+        elapsed_seconds = time.perf_counter() - start_time
+        best_seconds = elapsed_seconds if best_seconds is None else min(best_seconds, elapsed_seconds)
+    # ru_maxrss is in kilobytes on linux and bytes on macOS
+    rss_unit = 1 if sys.platform == 'darwin' else 1024
+    return best_seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit, \
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * rss_unit
+
+
+def run_benchmarks(names, durations, bit_depths, channel_counts, repeat, workdir):
+    """Returns a dict from case name to its results.
+    """
+    cases = []
+    for duration_seconds in durations:
+        for bits_per_sample in bit_depths:
+            for num_channels in channel_counts:
+                case_format = (duration_seconds, bits_per_sample, num_channels)
+                num_frames = int(duration_seconds * SAMPLE_RATE)
+                num_samples = num_frames * num_channels
+                src_filename = None
+                if any(benchmarks_by_name[name][1] for name in names):
+                    src_filename = os.path.join(workdir, 'src_%gs_%dbit_%dch.wav' % case_format)
+                    make_wav_file(src_filename, *case_format)
+                for name in names:
+                    if name == 'transform_per_sample' and num_frames > MAX_FRAMES_FOR_PER_SAMPLE:
+                        continue
+                    case_name = '%s[%gs,%dbit,%dch]' % ((name,) + case_format)
+                    # Bytes of the file read, or of the sound data generated
+                    num_bytes = os.path.getsize(src_filename) if benchmarks_by_name[name][1] else \
+                            num_samples * bits_per_sample // 8
+                    cases.append((case_name, name, src_filename, case_format, num_samples, num_bytes))
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for case_name, name, src_filename, case_format, num_samples, num_bytes in cases:
+        dest_filename = os.path.join(workdir, 'dest.wav')
+        # A new executor per case gives each case a fresh process, and unlike the daemonic workers of
+        #   multiprocessing.Pool its process can start the workers of transform_parallel
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            seconds, peak_rss, children_peak_rss = executor.submit(run_case, name, src_filename, dest_filename,
+                    case_format, repeat).result()
+        results[case_name] = {
+            'seconds': seconds,
+            'samples_per_second': num_samples / seconds,
+            'megabytes_per_second': num_bytes / 1e6 / seconds,
+            'peak_rss_bytes': peak_rss,
+            'children_peak_rss_bytes': children_peak_rss
+        }
+        click.echo("%-44s %9.4f s %14.0f samples/s %9.1f MB/s %8.1f MB peak RSS %8.1f MB workers" % (case_name,
+                seconds, results[case_name]['samples_per_second'], results[case_name]['megabytes_per_second'],
+                peak_rss / 1e6, children_peak_rss / 1e6))
+    return results
+
+
+def compare_to_baseline(results, baseline, threshold):
+    """Prints the change in samples/s of every case that is in the baseline and
+    returns the names of the cases that got slower by more than threshold.
+    """
+    regressions = []
+    for case_name, result in results.items():
+        if case_name not in baseline:
+            continue
+        ratio = result['samples_per_second'] / baseline[case_name]['samples_per_second']
+        is_regression = ratio < 1 - threshold
+        if is_regression:
+            regressions.append(case_name)
+        click.echo("%-44s %6.2fx%s" % (case_name, ratio, '  REGRESSION' if is_regression else ''))
+    return regressions
+
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(',')]
+
+
+@click.command()
+@click.option('-b', '--benchmark', 'names', multiple=True, type=click.Choice(list(benchmarks_by_name.keys())),
+        help="Benchmark to run, can be given many times, defaults to all")
+@click.option('--durations', default='5,30', help="Comma separated durations in seconds of the synthesized files")
+@click.option('--bits', default='8,16,24,32', help="Comma separated bit depths of the synthesized files")
+@click.option('--channels', default='1,2,6', help="Comma separated channel counts of the synthesized files")
+@click.option('--repeat', default=3, help="Number of runs per case, the fastest is reported")
+@click.option('--save', 'save_filename', default=None, help="Write the results to this JSON file as a baseline")
+@click.option('--compare', 'baseline_filename', default=None, help="Compare the results to this baseline JSON file")
+@click.option('--threshold', default=0.1, help="Slowdown in samples/s beyond which --compare fails, 0.1 is 10%")
+def main(names, durations, bits, channels, repeat, save_filename, baseline_filename, threshold):
+    """Benchmark the read, transform and generation hot paths of wav_file_util.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run_benchmarks(names or list(benchmarks_by_name.keys()), parse_list(durations, float),
+                parse_list(bits, int), parse_list(channels, int), repeat, workdir)
+    if save_filename is not None:
+        with open(save_filename, 'w') as save_file:
+            json.dump(results, save_file, indent=2, sort_keys=True)
+    if baseline_filename is not None:
+        with open(baseline_filename) as baseline_file:
+            regressions = compare_to_baseline(results, json.load(baseline_file), threshold)
+        if regressions:
+            click.echo("%d cases regressed by more than %d%%" % (len(regressions), threshold * 100))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,7 @@ setup(
     author="Stan Rokita",
     author_email="srok35@gmail.com",
     packages=["wav_file_util"],
-    install_requires=['click'],
+    install_requires=['click', 'numpy'],
     extras_require={
         'dev': ['pylint']
     },
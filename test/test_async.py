@@ -0,0 +1,116 @@
+import os
+import time
+import asyncio
+import concurrent.futures
+
+import numpy as np
+import pytest
+
+from wav_file_util import wav_file as wav_file_module
+from wav_file_util.wav_file import WavFile, AsyncWavWriter
+
+
+TEST_WAV_FILENAME = os.path.join(os.path.dirname(__file__), 'wav_files', 'vocal_loop_1.wav')
+
+
+async def collect_blocks(wav_file, **kwargs):
+    return [(frame_index, frames) async for frame_index, frames in wav_file.aiter_blocks(**kwargs)]
+
+
+@pytest.mark.parametrize('start_frame, end_frame, read_ahead', [(0, None, 1), (0, None, 4), (1234, 200000, 2)])
+def test_aiter_blocks_yields_every_frame(start_frame, end_frame, read_ahead):
+    with WavFile.open_existing(TEST_WAV_FILENAME) as wav_file:
+        blocks = asyncio.run(collect_blocks(wav_file, start_frame=start_frame, end_frame=end_frame,
+                read_ahead=read_ahead))
+        assert blocks[0][0] == start_frame
+        for (frame_index, frames), (next_frame_index, _) in zip(blocks, blocks[1:]):
+            assert next_frame_index == frame_index + len(frames)
+        assert np.array_equal(np.concatenate([frames for _, frames in blocks]), wav_file.frames[start_frame:end_frame])
+
+
+@pytest.fixture
+def slow_reads(monkeypatch):
+    """Makes every read after the first slow and returns the list of errors the
+    reads raise.
+    """
+    read_frames_block = wav_file_module._read_frames_block
+    errors = []
+    num_reads = [0]
+
+    def slow_read_frames_block(*args):
+        num_reads[0] += 1
+        if num_reads[0] > 1:
+            time.sleep(0.05)
+        try:
+            return read_frames_block(*args)
+        except Exception as e:
+            errors.append(e)
+            raise
+
+    monkeypatch.setattr(wav_file_module, '_read_frames_block', slow_read_frames_block)
+    return errors
+
+
+def test_aiter_blocks_closes_file_after_reads_in_flight(slow_reads):
+    async def read_first_block():
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            blocks = WavFile.open_existing(TEST_WAV_FILENAME).aiter_blocks(read_ahead=4, executor=executor)
+            async for _ in blocks:
+                break
+            await blocks.aclose()
+
+    asyncio.run(read_first_block())
+    assert slow_reads == []
+
+
+def test_aiter_blocks_closes_file_after_reads_in_flight_when_cancelled(slow_reads):
+    async def read_all_blocks(executor):
+        async for _ in WavFile.open_existing(TEST_WAV_FILENAME).aiter_blocks(read_ahead=4, executor=executor):
+            pass
+
+    async def cancel_while_reading():
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            task = asyncio.ensure_future(read_all_blocks(executor))
+            await asyncio.sleep(0.02)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(cancel_while_reading())
+    assert slow_reads == []
+
+
+@pytest.mark.parametrize('bits_per_sample, num_channels, num_frames', [(24, 2, 100000), (8, 1, 1001)])
+def test_async_wav_writer_round_trip(tmp_path, bits_per_sample, num_channels, num_frames):
+    frames = np.random.default_rng(0).integers(-100, 100, (num_frames, num_channels))
+    filename = str(tmp_path / 'out.wav')
+
+    async def write_blocks():
+        async with AsyncWavWriter(filename, 48000, bits_per_sample, num_channels) as writer:
+            for start_frame in range(0, num_frames, 777):
+                await writer.write(frames[start_frame:start_frame + 777])
+
+    asyncio.run(write_blocks())
+    # An odd sized data chunk is followed by a pad byte
+    data_size = num_frames * num_channels * bits_per_sample // 8
+    with WavFile.open_existing(filename) as wav_file:
+        assert wav_file.meta_data.format_chunk_sample_rate == 48000
+        assert wav_file.meta_data.data_chunk_size == data_size
+        assert os.path.getsize(filename) == wav_file._get_data_offset() + data_size + data_size % 2
+        assert np.array_equal(wav_file.frames[:], frames)
+
+
+def test_async_copy_matches_source(tmp_path):
+    filename = str(tmp_path / 'copy.wav')
+
+    async def copy():
+        src_wav_file = await WavFile.aopen_existing(TEST_WAV_FILENAME)
+        meta_data = src_wav_file.meta_data
+        async with AsyncWavWriter(filename, meta_data.format_chunk_sample_rate, meta_data.format_chunk_bits_per_sample,
+                meta_data.format_chunk_num_channels) as writer:
+            async for _, frames in src_wav_file.aiter_blocks():
+                await writer.write(frames)
+
+    asyncio.run(copy())
+    with WavFile.open_existing(TEST_WAV_FILENAME) as src_wav_file, WavFile.open_existing(filename) as wav_file:
+        assert np.array_equal(wav_file.frames[:], src_wav_file.frames[:])
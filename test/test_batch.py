@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import pytest
+
+from wav_file_util.wav_file import WavFile
+from wav_file_util.generation import SineWaveForm
+from wav_file_util import batch as wav_batch
+
+
+TEST_WAV_FILENAME = os.path.join(os.path.dirname(__file__), 'wav_files', 'vocal_loop_1.wav')
+
+
+def test_glob_keeps_layout_under_output_dir(tmp_path):
+    for sub_dir in ('a', 'b'):
+        os.makedirs(str(tmp_path / 'in' / sub_dir))
+        shutil.copyfile(TEST_WAV_FILENAME, str(tmp_path / 'in' / sub_dir / 'take.wav'))
+    file_pairs = wav_batch.find_wav_files([str(tmp_path / 'in' / '*' / '*.wav')], str(tmp_path / 'out'))
+    assert [dest_filename for _, dest_filename in file_pairs] == \
+            [str(tmp_path / 'out' / 'a' / 'take.wav'), str(tmp_path / 'out' / 'b' / 'take.wav')]
+
+
+def test_tasks_with_the_same_output_fail(tmp_path):
+    dest_filename = str(tmp_path / 'out.wav')
+    tasks = [(TEST_WAV_FILENAME, dest_filename, wav_batch.transform_file,
+            (operation, TEST_WAV_FILENAME, dest_filename)) for operation in ('no-left-channel', 'no-right-channel')]
+    summary = wav_batch.run_batch(tasks, workers=1)
+    assert summary.num_processed == 1
+    assert len(summary.failures) == 1
+    assert os.path.exists(dest_filename)
+
+
+def test_failed_write_leaves_no_output(tmp_path):
+    dest_filename = str(tmp_path / 'out.wav')
+
+    def write_half(filename):
+        with open(filename, 'wb') as f:
+            f.write(b'RIFF')
+        raise IOError("disk full")
+
+    with pytest.raises(IOError):
+        wav_batch.write_replacing(dest_filename, write_half)
+    assert os.listdir(str(tmp_path)) == []
+    assert not wav_batch.is_up_to_date(TEST_WAV_FILENAME, dest_filename)
+
+
+def test_channel_removal_of_mono_file_fails_without_output(tmp_path):
+    src_filename = str(tmp_path / 'mono.wav')
+    WavFile.create_new_wav_file_with_wave_form(src_filename, SineWaveForm(440), num_channels=1, duration_seconds=0.1)
+    dest_filename = str(tmp_path / 'out' / 'mono.wav')
+    summary = wav_batch.run_batch([(src_filename, dest_filename, wav_batch.transform_file,
+            ('no-right-channel', src_filename, dest_filename))], workers=1)
+    assert [type(error) for _, error in summary.failures] == [ValueError]
+    assert not os.path.exists(dest_filename)
+
+
+def test_directory_search_matches_extension_in_any_case(tmp_path):
+    for relative_filename in ('a.wav', os.path.join('sub', 'B.WAV'), os.path.join('sub', 'c.Wav'), 'notes.txt'):
+        os.makedirs(os.path.dirname(str(tmp_path / 'in' / relative_filename)), exist_ok=True)
+        shutil.copyfile(TEST_WAV_FILENAME, str(tmp_path / 'in' / relative_filename))
+    os.makedirs(str(tmp_path / 'in' / 'dir.wav'))
+    file_pairs = wav_batch.find_wav_files([str(tmp_path / 'in')], str(tmp_path / 'out'))
+    assert [os.path.relpath(src_filename, str(tmp_path / 'in')) for src_filename, _ in file_pairs] == \
+            ['a.wav', os.path.join('sub', 'B.WAV'), os.path.join('sub', 'c.Wav')]
+    assert file_pairs[1][1] == str(tmp_path / 'out' / 'sub' / 'B.WAV')
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from wav_file_util.wav_file import WavFile
+from wav_file_util.generation import SineWaveForm, SquareWaveForm, SawtoothWaveForm, SweepWaveForm, \
+        MultiToneWaveForm
+
+
+SAMPLE_RATE = 44100
+
+
+def get_power_spectrum(y):
+    # Remove the DC offset of the [0,1] range so it does not count as a harmonic
+    return np.abs(np.fft.rfft(y - y.mean())) ** 2
+
+
+@pytest.mark.parametrize('wave_form_class, frequency, max_spurious_db', [
+        (SquareWaveForm, 440, -110),
+        (SawtoothWaveForm, 3000, -125),
+        (SineWaveForm, 1000, -125)])
+def test_render_is_band_limited(wave_form_class, frequency, max_spurious_db):
+    # One second at a whole frequency puts every harmonic in a bin that is a multiple of it,
+    #   so aliases of the harmonics above Nyquist land in the other bins
+    power = get_power_spectrum(wave_form_class(frequency).render(0, SAMPLE_RATE, SAMPLE_RATE))
+    is_harmonic = np.arange(len(power)) % frequency == 0
+    spurious_db = 10 * np.log10(power[~is_harmonic].max() / power[frequency])
+    assert spurious_db < max_spurious_db
+
+
+@pytest.mark.parametrize('wave_form_class', [SineWaveForm, SquareWaveForm, SawtoothWaveForm])
+@pytest.mark.parametrize('frequency', [440, 441, 1000.5])
+def test_render_is_in_tune(wave_form_class, frequency):
+    # Two seconds give bins every half Hz
+    power = get_power_spectrum(wave_form_class(frequency).render(0, 2 * SAMPLE_RATE, SAMPLE_RATE))
+    assert np.argmax(power) == frequency * 2
+
+
+def test_generated_file_is_in_tune(tmp_path):
+    filename = str(tmp_path / 'sine.wav')
+    WavFile.create_new_wav_file_with_wave_form(filename, SineWaveForm(440), sample_rate=SAMPLE_RATE,
+            duration_seconds=1)
+    with WavFile.open_existing(filename) as wav_file:
+        frames = wav_file.frames[:]
+    assert len(frames) == SAMPLE_RATE
+    assert np.argmax(get_power_spectrum(frames[:, 0].astype(np.float64))) == 440
+
+
+@pytest.mark.parametrize('wave_form', [
+        SineWaveForm(440),
+        SquareWaveForm(440.5),
+        SawtoothWaveForm(3000),
+        SweepWaveForm(20, 20000, 0.5),
+        SweepWaveForm(5000, 100, 0.25, wavetable_name='square'),
+        MultiToneWaveForm([100, 1000, 10000])])
+def test_render_does_not_depend_on_blocks(wave_form):
+    num_frames = SAMPLE_RATE
+    y = wave_form.render(0, num_frames, SAMPLE_RATE)
+    assert y.min() >= 0 and y.max() <= 1
+    block_starts = [0, 1, 1000, 1023, 30000, num_frames]
+    blocks = [wave_form.render(start_frame, end_frame - start_frame, SAMPLE_RATE)
+            for start_frame, end_frame in zip(block_starts, block_starts[1:])]
+    assert np.array_equal(np.concatenate(blocks), y)
+    # Later ranges can be rendered first
+    assert np.array_equal(wave_form.render(30000, 100, SAMPLE_RATE), y[30000:30100])
+
+
+def test_sweep_frequencies_follow_phases():
+    sweep = SweepWaveForm(100, 1000, 0.5)
+    frequencies = sweep.get_frequencies(0, SAMPLE_RATE, SAMPLE_RATE)
+    assert frequencies[0] == pytest.approx(100)
+    assert frequencies[SAMPLE_RATE // 4] == pytest.approx(np.sqrt(100 * 1000))
+    assert np.all(frequencies[SAMPLE_RATE // 2:] == pytest.approx(1000))
+    # The phase advances by the frequency at each frame
+    phase_steps = np.diff(sweep.get_phases(0, SAMPLE_RATE, SAMPLE_RATE)) * SAMPLE_RATE
+    assert phase_steps == pytest.approx(frequencies[:-1], rel=1e-3)
+
+
+def test_sweep_ends_at_end_frequency():
+    y = SweepWaveForm(100, 1000, 0.5).render(0, SAMPLE_RATE, SAMPLE_RATE)
+    # Half a second after the sweep gives bins every 2 Hz
+    assert np.argmax(get_power_spectrum(y[SAMPLE_RATE // 2:])) * 2 == 1000
+
+
+def test_sweep_without_change_is_a_tone():
+    y = SweepWaveForm(440, 440, 1).render(0, SAMPLE_RATE, SAMPLE_RATE)
+    assert y == pytest.approx(SineWaveForm(440).render(0, SAMPLE_RATE, SAMPLE_RATE))
+
+
+def test_multi_tone_has_each_tone_at_the_same_level():
+    frequencies = [100, 1000, 10000]
+    power = get_power_spectrum(MultiToneWaveForm(frequencies).render(0, SAMPLE_RATE, SAMPLE_RATE))
+    assert sorted(np.argsort(power)[-3:]) == frequencies
+    assert power[frequencies] == pytest.approx(power[100], rel=1e-3)
+    # Each tone is one of the averaged wave forms
+    assert power[frequencies] == pytest.approx(get_power_spectrum(
+            SineWaveForm(1000).render(0, SAMPLE_RATE, SAMPLE_RATE))[1000] / 9, rel=1e-3)
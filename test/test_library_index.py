@@ -0,0 +1,42 @@
+import os
+import shutil
+import struct
+
+from wav_file_util.library_index import LibraryIndex
+
+
+TEST_WAV_FILENAME = os.path.join(os.path.dirname(__file__), 'wav_files', 'vocal_loop_1.wav')
+
+# Offsets of the sample rate and bits per sample fields of the fmt chunk of the test file
+SAMPLE_RATE_OFFSET = 24
+BITS_PER_SAMPLE_OFFSET = 34
+
+
+def copy_with_field(filename, offset, fmt, value):
+    shutil.copyfile(TEST_WAV_FILENAME, filename)
+    with open(filename, 'r+b') as f:
+        f.seek(offset)
+        f.write(struct.pack(fmt, value))
+
+
+def test_scan_records_bad_headers_and_keeps_going(tmp_path):
+    shutil.copyfile(TEST_WAV_FILENAME, str(tmp_path / 'good.wav'))
+    copy_with_field(str(tmp_path / 'zero_rate.wav'), SAMPLE_RATE_OFFSET, '<I', 0)
+    copy_with_field(str(tmp_path / 'zero_bits.wav'), BITS_PER_SAMPLE_OFFSET, '<H', 0)
+    with LibraryIndex(str(tmp_path / 'index.sqlite')) as index:
+        summary = index.scan([str(tmp_path)])
+        assert summary.num_read == 3
+        assert sorted(os.path.basename(filename) for filename, _ in summary.errors) == \
+                ['zero_bits.wav', 'zero_rate.wav']
+        rows = index.query()
+        assert [os.path.basename(row['path']) for row in rows] == ['good.wav']
+        assert rows[0]['num_frames'] == 220500
+        assert len(index.query(include_errors=True)) == 3
+
+
+def test_scan_finds_upper_case_extensions(tmp_path):
+    os.makedirs(str(tmp_path / 'sub'))
+    shutil.copyfile(TEST_WAV_FILENAME, str(tmp_path / 'sub' / 'TAKE1.WAV'))
+    with LibraryIndex(str(tmp_path / 'index.sqlite')) as index:
+        assert index.scan([str(tmp_path)]).num_read == 1
+        assert [os.path.basename(row['path']) for row in index.query()] == ['TAKE1.WAV']
@@ -0,0 +1,21 @@
+import time
+
+from wav_file_util.metrics import ProcessingMetrics, time_stage
+
+
+def test_time_stage_adds_to_the_stage():
+    metrics = ProcessingMetrics()
+    with time_stage(metrics, 'read'):
+        pass
+    with time_stage(metrics, 'read'):
+        pass
+    assert list(metrics.stage_seconds) == ['read']
+
+
+def test_time_stage_without_metrics_does_not_read_the_clock(monkeypatch):
+    def fail():
+        raise AssertionError("The clock was read")
+
+    monkeypatch.setattr(time, 'perf_counter', fail)
+    with time_stage(None, 'read'):
+        pass
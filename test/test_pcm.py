@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from wav_file_util import pcm
+
+
+@pytest.mark.parametrize('bits_per_sample', [8, 16, 24, 32])
+def test_encode_decode_round_trip(bits_per_sample):
+    min_value, max_value = pcm.get_sample_value_range(bits_per_sample)
+    frames = np.random.default_rng(bits_per_sample).integers(min_value, max_value, (1000, 2), endpoint=True)
+    frames[:4] = [[min_value, max_value], [-1, 0], [1, min_value + 1], [max_value - 1, 0]]
+    data = pcm.encode_frames(frames, bits_per_sample)
+    assert len(data) == frames.size * bits_per_sample // 8
+    assert np.array_equal(pcm.decode_frames(data, 2, bits_per_sample), frames)
+
+
+@pytest.mark.parametrize('bits_per_sample, silence_byte', [(8, 0x80), (16, 0x00), (24, 0x00), (32, 0x00)])
+def test_silence_is_stored_as_in_wav_files(bits_per_sample, silence_byte):
+    # 8 bit samples are unsigned with silence at 128, every other bit depth is signed
+    data = pcm.encode_frames(np.zeros((3, 2), dtype=np.int32), bits_per_sample)
+    assert data == bytes([silence_byte]) * len(data)
+
+
+@pytest.mark.parametrize('bits_per_sample', [8, 16, 24, 32])
+def test_encode_clips_to_bit_depth(bits_per_sample):
+    min_value, max_value = pcm.get_sample_value_range(bits_per_sample)
+    frames = np.array([[min_value - 1, max_value + 1]], dtype=np.int64)
+    data = pcm.encode_frames(frames, bits_per_sample)
+    assert pcm.decode_frames(data, 2, bits_per_sample).tolist() == [[min_value, max_value]]
+
+
+def test_decode_ignores_partial_trailing_frame():
+    data = pcm.encode_frames(np.arange(6).reshape(3, 2), 24) + b'\x01\x02'
+    assert pcm.decode_frames(data, 2, 24).tolist() == [[0, 1], [2, 3], [4, 5]]
@@ -0,0 +1,48 @@
+import os
+import shutil
+import struct
+
+import pytest
+
+from wav_file_util import peaks
+
+
+TEST_WAV_FILENAME = os.path.join(os.path.dirname(__file__), 'wav_files', 'vocal_loop_1.wav')
+TEST_WAV_NUM_FRAMES = 220500
+
+# Offset of the size field of the data chunk of the test file
+DATA_CHUNK_SIZE_OFFSET = 40
+
+
+@pytest.mark.parametrize('super_chunk_size', [0, 36, 0xFFFFFFFF])
+def test_recording_in_progress_counts_frames_to_end_of_file(tmp_path, super_chunk_size):
+    wav_filename = str(tmp_path / 'recording.wav')
+    shutil.copyfile(TEST_WAV_FILENAME, wav_filename)
+    with open(wav_filename, 'r+b') as f:
+        f.seek(4)
+        f.write(struct.pack('<I', super_chunk_size))
+        f.seek(DATA_CHUNK_SIZE_OFFSET)
+        f.write(struct.pack('<I', 0))
+    assert peaks.update_peak_file(wav_filename) == 'built'
+    with peaks.open_peak_file(wav_filename) as peak_file:
+        assert peak_file.num_frames == TEST_WAV_NUM_FRAMES
+
+
+def test_appended_sidecar_matches_full_build(tmp_path):
+    wav_filename = str(tmp_path / 'recording.wav')
+    with open(TEST_WAV_FILENAME, 'rb') as f:
+        wav_bytes = f.read()
+    # Cut on a frame boundary of the 24 bit stereo test file with the data size still 0
+    cut_offset = 44 + 6 * 100000
+    with open(wav_filename, 'wb') as f:
+        f.write(wav_bytes[:4] + struct.pack('<I', 0) + wav_bytes[8:DATA_CHUNK_SIZE_OFFSET] + struct.pack('<I', 0) +
+                wav_bytes[DATA_CHUNK_SIZE_OFFSET + 4:cut_offset])
+    assert peaks.update_peak_file(wav_filename) == 'built'
+    with open(wav_filename, 'ab') as f:
+        f.write(wav_bytes[cut_offset:])
+    assert peaks.update_peak_file(wav_filename) == 'appended'
+    with open(peaks.get_peak_filename(wav_filename), 'rb') as f:
+        appended_bytes = f.read()[peaks.PEAK_FILE_HEADER_SIZE:]
+    peaks.update_peak_file(wav_filename, force=True)
+    with open(peaks.get_peak_filename(wav_filename), 'rb') as f:
+        assert f.read()[peaks.PEAK_FILE_HEADER_SIZE:] == appended_bytes
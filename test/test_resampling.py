@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from wav_file_util.resampling import PolyphaseResampler
+
+
+RATIOS = [(96000, 48000), (48000, 44100), (44100, 48000)]
+
+
+def resample(frames, src_rate, dest_rate, block_size=10000):
+    resampler = PolyphaseResampler(src_rate, dest_rate, frames.shape[1])
+    blocks = [resampler.process(frames[start:start + block_size]) for start in range(0, len(frames), block_size)]
+    blocks.append(resampler.flush())
+    return np.concatenate(blocks)
+
+
+def tone(freq, rate, num_frames, phase=0.0):
+    return np.sin(2 * np.pi * freq * np.arange(num_frames) / rate + phase)[:, np.newaxis]
+
+
+def middle(frames, rate):
+    # Leaves out the start and end of the output where the filter runs into the silence around the input
+    return frames[rate // 10:-(rate // 10), 0]
+
+
+@pytest.mark.parametrize('src_rate, dest_rate', RATIOS)
+@pytest.mark.parametrize('freq', [1000, 18000, 20000])
+def test_passband_is_flat_and_aligned(src_rate, dest_rate, freq):
+    output = resample(tone(freq, src_rate, src_rate), src_rate, dest_rate)
+    assert len(output) == dest_rate
+    expected = tone(freq, dest_rate, dest_rate)
+    # Any gain error or delay, even a fraction of a sample, shows up as a difference from the ideal tone
+    error = np.max(np.abs(middle(output, dest_rate) - middle(expected, dest_rate)))
+    assert 20 * np.log10(error) < -60
+
+
+@pytest.mark.parametrize('src_rate, dest_rate, freq', [(96000, 48000, 25500), (96000, 48000, 40000),
+        (48000, 44100, 23000)])
+def test_stopband_does_not_alias(src_rate, dest_rate, freq):
+    output = resample(tone(freq, src_rate, src_rate), src_rate, dest_rate)
+    level = np.sqrt(2 * np.mean(middle(output, dest_rate) ** 2))
+    assert 20 * np.log10(level) < -70
+
+
+def test_output_does_not_depend_on_block_size():
+    frames = np.random.default_rng(0).uniform(-1, 1, (20000, 2))
+    assert np.allclose(resample(frames, 48000, 44100, 20000), resample(frames, 48000, 44100, 333))
@@ -0,0 +1,68 @@
+import os
+
+import numpy as np
+import pytest
+from click.testing import CliRunner
+
+from wav_file_util.wav_file import WavFile
+from wav_file_util.__main__ import main
+from wav_file_util.generation import SineWaveForm
+from wav_file_util.transforms import parse_pipeline, check_block_transform, remove_left_channel, \
+        remove_left_channel_block, remove_right_channel, remove_right_channel_block
+
+
+TEST_WAV_FILENAME = os.path.join(os.path.dirname(__file__), 'wav_files', 'vocal_loop_1.wav')
+
+
+@pytest.mark.parametrize('operation', ['mute:2', 'mute:-1', 'dither:25', 'dither:0', 'gain:loud', 'reverse'])
+def test_parse_pipeline_rejects_operations_that_do_not_fit(operation):
+    with pytest.raises(ValueError):
+        parse_pipeline([operation], WavFile.open_existing(TEST_WAV_FILENAME))
+
+
+def test_parse_pipeline_accepts_operations_that_fit():
+    pipeline = parse_pipeline(['gain:-6', 'mute:1', 'fade-in:0.5', 'fade-out:2', 'dither:16', 'no-left-channel'],
+            WavFile.open_existing(TEST_WAV_FILENAME))
+    assert len(pipeline.stages) == 6
+
+
+@pytest.mark.parametrize('trans_func, block_trans_func', [(remove_left_channel, remove_left_channel_block),
+        (remove_right_channel, remove_right_channel_block)])
+def test_per_sample_transformation_matches_block_transformation(tmp_path, trans_func, block_trans_func):
+    src_wav_file = WavFile.open_existing(TEST_WAV_FILENAME)
+    per_sample_wav_file = WavFile.create_new_wav_file_with_transformation(src_wav_file, str(tmp_path / 'a.wav'),
+            trans_func=trans_func)
+    block_wav_file = WavFile.create_new_wav_file_with_transformation(src_wav_file, str(tmp_path / 'b.wav'),
+            block_trans_func=block_trans_func)
+    with per_sample_wav_file, block_wav_file:
+        assert np.array_equal(per_sample_wav_file.frames[:], block_wav_file.frames[:])
+
+
+@pytest.fixture
+def mono_wav_filename(tmp_path):
+    filename = str(tmp_path / 'mono.wav')
+    WavFile.create_new_wav_file_with_wave_form(filename, SineWaveForm(440), num_channels=1, duration_seconds=0.1)
+    return filename
+
+
+def test_channel_removal_needs_the_channel(mono_wav_filename):
+    wav_file = WavFile.open_existing(mono_wav_filename)
+    with pytest.raises(ValueError):
+        parse_pipeline(['no-right-channel'], wav_file)
+    check_block_transform('no-left-channel', wav_file)
+
+
+def test_convert_rejects_channel_removal_before_writing(tmp_path, mono_wav_filename):
+    out_filename = str(tmp_path / 'out.wav')
+    for args in (['-l', mono_wav_filename], ['-i', mono_wav_filename, '-p', 'no-right-channel']):
+        result = CliRunner().invoke(main, ['convert'] + args + [out_filename])
+        assert result.exit_code == 2
+        assert not os.path.exists(out_filename)
+
+
+@pytest.mark.parametrize('args', [['--channels', '0'], ['--sample-rate', '0'], ['-d', '-1']])
+def test_convert_rejects_out_of_range_formats(tmp_path, args):
+    out_filename = str(tmp_path / 'out.wav')
+    result = CliRunner().invoke(main, ['convert', '-w', 'sine'] + args + [out_filename])
+    assert result.exit_code == 2
+    assert not os.path.exists(out_filename)
@@ -0,0 +1,286 @@
+import os
+import struct
+
+import numpy as np
+import pytest
+
+from wav_file_util.wav_file import WavFile, WavFileMetaData
+from wav_file_util.transforms import TransformPipeline, GainStage, DitherStage
+from wav_file_util import pcm
+
+
+TEST_WAV_FILENAME = os.path.join(os.path.dirname(__file__), 'wav_files', 'vocal_loop_1.wav')
+
+
+def make_chunk(chunk_id, payload):
+    """Returns the bytes of a RIFF chunk, with a pad byte after an odd sized
+    payload.
+    """
+    return chunk_id + struct.pack('<I', len(payload)) + payload + b'\x00' * (len(payload) % 2)
+
+
+def make_fmt_chunk(num_channels, sample_rate, bits_per_sample):
+    block_align = num_channels * bits_per_sample // 8
+    return make_chunk(b'fmt ', struct.pack('<HHIIHH', 1, num_channels, sample_rate, sample_rate * block_align,
+            block_align, bits_per_sample))
+
+
+def write_wav_file(filename, frames, bits_per_sample, sample_rate=44100, chunks_before_data=(),
+        chunks_after_data=()):
+    """Writes frames to filename as a RIFF wav file with the given chunks
+    before and after its data chunk and returns the bytes written.
+    """
+    body = b'WAVE' + make_fmt_chunk(frames.shape[1], sample_rate, bits_per_sample) + b''.join(chunks_before_data)
+    body += make_chunk(b'data', pcm.encode_frames(frames, bits_per_sample)) + b''.join(chunks_after_data)
+    wav_bytes = b'RIFF' + struct.pack('<I', len(body)) + body
+    with open(filename, 'wb') as f:
+        f.write(wav_bytes)
+    return wav_bytes
+
+
+def write_rf64_file(filename, frames, bits_per_sample, sample_rate=44100, super_chunk_id=b'RF64',
+        chunks_after_data=()):
+    """Writes frames to filename as an RF64 wav file whose RIFF and data chunk
+    sizes are only in its ds64 chunk and returns the bytes written.
+    """
+    data = pcm.encode_frames(frames, bits_per_sample)
+    fmt_chunk = make_fmt_chunk(frames.shape[1], sample_rate, bits_per_sample)
+    riff_size = 4 + 8 + WavFileMetaData.DS64_CHUNK_SIZE + len(fmt_chunk) + 8 + len(data) + len(data) % 2 + \
+            sum(len(chunk) for chunk in chunks_after_data)
+    ds64_chunk = make_chunk(b'ds64', struct.pack('<QQQI', riff_size, len(data), len(frames), 0))
+    wav_bytes = super_chunk_id + struct.pack('<I', WavFileMetaData.RF64_PLACEHOLDER_SIZE) + b'WAVE' + ds64_chunk + \
+            fmt_chunk + b'data' + struct.pack('<I', WavFileMetaData.RF64_PLACEHOLDER_SIZE) + data + \
+            b'\x00' * (len(data) % 2) + b''.join(chunks_after_data)
+    with open(filename, 'wb') as f:
+        f.write(wav_bytes)
+    return wav_bytes
+
+
+def random_frames(num_frames, num_channels, bits_per_sample, seed=0):
+    min_value, max_value = pcm.get_sample_value_range(bits_per_sample)
+    return np.random.default_rng(seed).integers(min_value, max_value, (num_frames, num_channels), endpoint=True)
+
+
+def read_bytes(filename):
+    with open(filename, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('key', [(Ellipsis, 0), Ellipsis, (5, Ellipsis), (Ellipsis, [1, 0]),
+        (slice(10, 20), Ellipsis, 1)])
+def test_frames_index_with_ellipsis(key):
+    with WavFile.open_existing(TEST_WAV_FILENAME) as wav_file:
+        frames = wav_file.frames
+        assert np.array_equal(frames[key], frames[:][key])
+
+
+@pytest.mark.parametrize('bits_per_sample', [8, 16, 24, 32])
+def test_pcm_round_trip_through_file(tmp_path, bits_per_sample):
+    frames = random_frames(5001, 2, bits_per_sample)
+    src_filename = str(tmp_path / 'src.wav')
+    src_bytes = write_wav_file(src_filename, frames, bits_per_sample)
+    with WavFile.open_existing(src_filename) as src_wav_file:
+        assert src_wav_file._get_num_frames() == len(frames)
+        assert np.array_equal(src_wav_file.frames[:], frames)
+        # A transformation that changes nothing has to write back the same bytes
+        WavFile.create_new_wav_file_with_transformation(src_wav_file, str(tmp_path / 'dest.wav'),
+                block_trans_func=lambda frame_index, block: block)
+    assert read_bytes(str(tmp_path / 'dest.wav')) == src_bytes
+
+
+@pytest.mark.parametrize('chunks_before_data, chunks_after_data', [
+    ([make_chunk(b'LIST', b'INFOISFT\x03\x00\x00\x00ab\x00'), make_chunk(b'JUNK', b'\x00' * 3)], []),
+    ([], [make_chunk(b'LIST', b'INFOICMT\x05\x00\x00\x00abcd\x00'), make_chunk(b'JUNK', b'\x00' * 7)]),
+    ([make_chunk(b'JUNK', b'\x00')], [make_chunk(b'LIST', b'INFO'), make_chunk(b'id3 ', b'\x01' * 9)])
+])
+@pytest.mark.parametrize('num_frames', [1000, 1001])
+def test_chunks_around_data_are_kept(tmp_path, chunks_before_data, chunks_after_data, num_frames):
+    # 8 bit mono with an odd number of frames gives a data chunk with a pad byte
+    frames = random_frames(num_frames, 1, 8)
+    src_filename = str(tmp_path / 'src.wav')
+    src_bytes = write_wav_file(src_filename, frames, 8, chunks_before_data=chunks_before_data,
+            chunks_after_data=chunks_after_data)
+    with WavFile.open_existing(src_filename) as src_wav_file:
+        assert [chunk.chunk_id for chunk in src_wav_file.chunks] == ['fmt '] + \
+                [chunk[:4].decode() for chunk in chunks_before_data] + ['data'] + \
+                [chunk[:4].decode() for chunk in chunks_after_data]
+        assert np.array_equal(src_wav_file.frames[:], frames)
+        for workers in (1, 2):
+            dest_filename = str(tmp_path / ('dest_%d.wav' % workers))
+            WavFile.create_new_wav_file_with_transformation(src_wav_file, dest_filename, workers=workers)
+            assert read_bytes(dest_filename) == src_bytes
+
+
+@pytest.mark.parametrize('workers', [2, 3, 8])
+def test_parallel_transformation_matches_serial(tmp_path, workers):
+    src_wav_file = WavFile.open_existing(TEST_WAV_FILENAME)
+    pipeline = TransformPipeline([GainStage(-3.0), DitherStage(24, 16)])
+    serial_filename = str(tmp_path / 'serial.wav')
+    parallel_filename = str(tmp_path / 'parallel.wav')
+    WavFile.create_new_wav_file_with_transformation(src_wav_file, serial_filename, block_trans_func=pipeline)
+    WavFile.create_new_wav_file_with_transformation(src_wav_file, parallel_filename, block_trans_func=pipeline,
+            workers=workers)
+    assert read_bytes(parallel_filename) == read_bytes(serial_filename)
+
+
+@pytest.mark.parametrize('super_chunk_id', [b'RF64', b'BW64'])
+def test_rf64_read_and_copy(tmp_path, super_chunk_id):
+    frames = random_frames(3001, 2, 24)
+    src_filename = str(tmp_path / 'src.wav')
+    src_bytes = write_rf64_file(src_filename, frames, 24, super_chunk_id=super_chunk_id,
+            chunks_after_data=[make_chunk(b'LIST', b'INFOICMT\x01\x00\x00\x00a\x00')])
+    with WavFile.open_existing(src_filename) as src_wav_file:
+        assert src_wav_file.meta_data.is_rf64()
+        assert src_wav_file.meta_data.data_chunk_size == len(frames) * 6
+        assert src_wav_file.meta_data.super_chunk_size == len(src_bytes) - 8
+        assert [chunk.chunk_id for chunk in src_wav_file.chunks] == ['ds64', 'fmt ', 'data', 'LIST']
+        assert np.array_equal(src_wav_file.frames[:], frames)
+        WavFile.create_new_wav_file_with_transformation(src_wav_file, str(tmp_path / 'dest.wav'), workers=2)
+    assert read_bytes(str(tmp_path / 'dest.wav')) == src_bytes
+
+
+def test_rf64_write_and_read_back(tmp_path):
+    frames = random_frames(2000, 2, 16)
+    data = pcm.encode_frames(frames, 16)
+    meta_data = WavFileMetaData.make_default(48000, 16, 2, None)
+    meta_data.super_chunk_id = WavFileMetaData.SUPER_CHUNK_ID_RF64
+    meta_data.set_data_chunk_size(len(data))
+    filename = str(tmp_path / 'rf64.wav')
+    with open(filename, 'wb') as f:
+        f.write(meta_data.get_bytes() + data)
+    with WavFile.open_existing(filename) as wav_file:
+        assert wav_file.meta_data.super_chunk_id == WavFileMetaData.SUPER_CHUNK_ID_RF64
+        assert wav_file.meta_data.data_chunk_size == len(data)
+        assert wav_file.meta_data.super_chunk_size == os.path.getsize(filename) - 8
+        assert np.array_equal(wav_file.frames[:], frames)
+
+
+def test_header_becomes_rf64_in_place_when_sizes_do_not_fit_32_bits():
+    meta_data = WavFileMetaData.make_default(48000, 16, 2, None)
+    riff_header_bytes = meta_data.get_bytes()
+    assert riff_header_bytes[:4] == b'RIFF' and riff_header_bytes[12:16] == b'JUNK'
+    data_chunk_size = 5 * 2 ** 30
+    meta_data.set_data_chunk_size(data_chunk_size)
+    rf64_header_bytes = meta_data.get_bytes()
+    # The reserved JUNK chunk is replaced by the ds64 chunk so the sound data does not move
+    assert len(rf64_header_bytes) == len(riff_header_bytes)
+    assert rf64_header_bytes[:4] == b'RF64' and rf64_header_bytes[12:16] == b'ds64'
+    assert struct.unpack_from('<I', rf64_header_bytes, 4)[0] == WavFileMetaData.RF64_PLACEHOLDER_SIZE
+    assert struct.unpack_from('<QQQ', rf64_header_bytes, 20) == \
+            (len(rf64_header_bytes) - 8 + data_chunk_size, data_chunk_size, data_chunk_size // 4)
+    assert struct.unpack_from('<I', rf64_header_bytes, len(rf64_header_bytes) - 4)[0] == \
+            WavFileMetaData.RF64_PLACEHOLDER_SIZE
+
+
+def test_extensible_format_round_trip(tmp_path):
+    frames = random_frames(1000, 6, 24)
+    meta_data = WavFileMetaData.make_default(48000, 24, 6, len(frames) / 48000)
+    assert meta_data.is_extensible()
+    filename = str(tmp_path / 'surround.wav')
+    with open(filename, 'wb') as f:
+        f.write(meta_data.get_bytes() + pcm.encode_frames(frames, 24))
+    with WavFile.open_existing(filename) as wav_file:
+        assert wav_file.meta_data.format_chunk_sub_format == WavFileMetaData.FORMAT_CHUNK_SUB_FORMAT_PCM
+        assert wav_file.meta_data.format_chunk_channel_mask == 0x3F
+        assert np.array_equal(wav_file.frames[:], frames)
+
+
+def read_sizes(filename):
+    """Returns the RIFF size and the size of the data chunk of a 44 byte header
+    RIFF file.
+    """
+    with open(filename, 'rb') as f:
+        header = f.read(44)
+    return struct.unpack_from('<I', header, 4)[0], struct.unpack_from('<I', header, 40)[0]
+
+
+@pytest.mark.parametrize('super_chunk_size, data_chunk_size', [(0xFFFFFFFF, 0xFFFFFFFF), (0, 0)])
+def test_transformation_of_stream_writes_real_sizes(tmp_path, super_chunk_size, data_chunk_size):
+    frames = random_frames(1001, 1, 8)
+    src_filename = str(tmp_path / 'stream.wav')
+    src_bytes = bytearray(write_wav_file(src_filename, frames, 8))
+    struct.pack_into('<I', src_bytes, 4, super_chunk_size)
+    struct.pack_into('<I', src_bytes, 40, data_chunk_size)
+    # Streams have no pad byte after the data
+    with open(src_filename, 'wb') as f:
+        f.write(src_bytes[:-1])
+    dest_filename = str(tmp_path / 'dest.wav')
+    WavFile.create_new_wav_file_with_transformation(WavFile.open_existing(src_filename), dest_filename)
+    assert read_sizes(dest_filename) == (os.path.getsize(dest_filename) - 8, 1001)
+    assert read_bytes(dest_filename) == bytes(write_wav_file(str(tmp_path / 'expected.wav'), frames, 8))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_transformation_of_truncated_file_writes_real_sizes(tmp_path, workers):
+    src_filename = str(tmp_path / 'truncated.wav')
+    with open(src_filename, 'wb') as f:
+        f.write(read_bytes(TEST_WAV_FILENAME)[:44 + 100000])
+    dest_filename = str(tmp_path / 'dest.wav')
+    WavFile.create_new_wav_file_with_transformation(WavFile.open_existing(src_filename), dest_filename,
+            workers=workers)
+    assert read_sizes(dest_filename) == (36 + 100000, 100000)
+    with WavFile.open_existing(dest_filename) as wav_file, WavFile.open_existing(TEST_WAV_FILENAME) as src_wav_file:
+        assert np.array_equal(wav_file.frames[:], src_wav_file.frames[:100000 // 6])
+
+
+def test_analyze_levels_of_each_channel(tmp_path):
+    # More frames than fit in one block so the statistics are added up over blocks
+    num_frames = 100000
+    frames = np.zeros((num_frames, 3), dtype=np.int64)
+    # A -6 dBFS square wave whose first 100 frames are at -66 dBFS, below the silence threshold
+    frames[:, 0] = np.where(np.arange(num_frames) % 2 == 0, 16384, -16384)
+    frames[:100, 0] //= 1024
+    # A constant with 10 frames clipped at the top and 5 at the bottom
+    frames[:, 1] = 8192
+    frames[:10, 1] = 32767
+    frames[10:15, 1] = -32768
+    filename = str(tmp_path / 'levels.wav')
+    write_wav_file(filename, frames, 16, sample_rate=50000)
+    with WavFile.open_existing(filename) as wav_file:
+        analysis = wav_file.analyze()
+    assert analysis['num_frames'] == num_frames
+    assert analysis['duration_seconds'] == 2.0
+    assert (analysis['bits_per_sample'], analysis['num_channels']) == (16, 3)
+    square, constant, silent = analysis['channels']
+    assert square['peak'] == 16384
+    assert square['peak_dbfs'] == pytest.approx(-6.0206)
+    assert square['rms'] == pytest.approx(np.sqrt((100 * 16 ** 2 + (num_frames - 100) * 16384 ** 2) / num_frames))
+    assert square['dc_offset'] == 0.0
+    assert square['clipped_samples'] == 0
+    assert square['silent_frames'] == 100
+    assert not square['is_silent']
+    assert constant['peak'] == 32768
+    assert constant['peak_dbfs'] == 0.0
+    assert constant['rms'] == pytest.approx(np.sqrt(np.mean(np.square(frames[:, 1], dtype=np.float64))))
+    assert constant['dc_offset'] == pytest.approx((10 * 32767 - 5 * 32768 + (num_frames - 15) * 8192) / num_frames /
+            32768)
+    assert constant['clipped_samples'] == 15
+    assert constant['silent_frames'] == 0
+    assert silent == {'peak': 0, 'peak_dbfs': None, 'rms': 0.0, 'rms_dbfs': None, 'dc_offset': 0.0,
+            'clipped_samples': 0, 'silent_frames': num_frames, 'is_silent': True}
+
+
+def test_analyze_8_bit_levels_are_signed(tmp_path):
+    # 8 bit samples are stored unsigned so 128 is silence and 0 is the most negative value
+    frames = np.array([[-128], [127], [0], [-32], [64], [-64], [0], [1]])
+    filename = str(tmp_path / '8bit.wav')
+    write_wav_file(filename, frames, 8)
+    with WavFile.open_existing(filename) as wav_file:
+        channel, = wav_file.analyze(silence_threshold_db=-40.0)['channels']
+    assert channel['peak'] == 128
+    assert channel['peak_dbfs'] == 0.0
+    assert channel['rms'] == pytest.approx(np.sqrt((128 ** 2 + 127 ** 2 + 32 ** 2 + 2 * 64 ** 2 + 1) / 8))
+    assert channel['dc_offset'] == -32 / 8 / 128
+    assert channel['clipped_samples'] == 2
+    # Silence is at or below 1.28, so 1 is silent too
+    assert channel['silent_frames'] == 3
+
+
+def test_analyze_file_without_frames(tmp_path):
+    filename = str(tmp_path / 'empty.wav')
+    write_wav_file(filename, np.zeros((0, 2), dtype=np.int64), 24)
+    with WavFile.open_existing(filename) as wav_file:
+        analysis = wav_file.analyze()
+    assert (analysis['num_frames'], analysis['duration_seconds']) == (0, 0.0)
+    assert analysis['channels'] == [{'peak': 0, 'peak_dbfs': None, 'rms': 0.0, 'rms_dbfs': None, 'dc_offset': 0.0,
+            'clipped_samples': 0, 'silent_frames': 0, 'is_silent': True}] * 2
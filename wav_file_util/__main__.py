@@ -2,51 +2,276 @@
 
 """
 
-from wav_file_util.wav_file import WavFile
+import os
+import json
+import math
+import cProfile
+
+from wav_file_util.wav_file import WavFile, WavFileMetaData
 from wav_file_util.generation import wave_forms_by_name
+from wav_file_util.transforms import remove_left_channel_block, remove_right_channel_block, block_transforms_by_name, \
+        check_block_transform, parse_pipeline
+from wav_file_util import batch as wav_batch
+from wav_file_util import library_index
+from wav_file_util import peaks
+from wav_file_util.metrics import ProcessingMetrics
 
 import click
 
 
-def remove_left_channel(channel_index, sample_value):
-        if channel_index == 1:
-            return 0
-        else:
-            return sample_value
+def start_profiler(profile_filename):
+    """Profiles the rest of the current command with cProfile and writes the
+    stats to profile_filename when it finishes, even if it fails. They can be
+    read with the pstats module or tools like snakeviz.
+    """
+    profiler = cProfile.Profile()
 
+    def dump_stats():
+        profiler.disable()
+        profiler.dump_stats(profile_filename)
 
-def remove_right_channel(channel_index, sample_value):
-        if channel_index == 0:
-            return 0
-        else:
-            return sample_value
+    click.get_current_context().call_on_close(dump_stats)
+    profiler.enable()
+
+
+class DefaultCommandGroup(click.Group):
+    """Click group that falls back to its default command when the first
+    argument is not the name of a subcommand, so the original single command
+    usage e.g. wav_file_util -l in.wav out.wav keeps working.
+
+    """
 
+    def __init__(self, *args, default_command_name=None, **kwargs):
+        click.Group.__init__(self, *args, **kwargs)
+        self.default_command_name = default_command_name
 
-@click.command()
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args.insert(0, self.default_command_name)
+        return click.Group.parse_args(self, ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup, default_command_name='convert')
+def main():
+    """Wave file utility program. Run a subcommand or pass the options of
+    convert directly.
+    """
+
+
+@main.command()
 @click.option('-l', '--no-right-channel', 'nrc_file', default=None)
 @click.option('-r', '--no-left-channel', 'nlc_file', default=None)
 @click.option('-w', '--wave-type', type=click.Choice(list(wave_forms_by_name.keys())), default=None)
 @click.option('-f', '--frequency', default=440)
+@click.option('--sample-rate', type=click.IntRange(min=1), default=WavFileMetaData.FORMAT_CHUNK_SAMPLE_RATE_DEFAULT,
+        help="Sample rate in Hz of the generated wav file")
+@click.option('--bits', type=click.Choice(['8', '16', '24', '32']), default=str(WavFileMetaData.BYTES_PER_SAMPLE_DEFAULT * 8),
+        help="Bits per sample of the generated wav file")
+@click.option('--channels', type=click.IntRange(min=1), default=WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED,
+        help="Number of channels of the generated wav file")
+@click.option('-d', '--duration', type=click.FloatRange(min=0),
+        default=float(WavFileMetaData.AUDIO_DURATION_IN_SECONDS_DEFAULT),
+        help="Seconds of audio to generate, inf generates until interrupted")
+@click.option('-i', '--in-file', default=None, help="Wav file to apply the --operation pipeline to")
+@click.option('-p', '--operation', 'operations', multiple=True,
+        help="Operation such as gain:-6, mute:1, fade-in:0.5, fade-out:2 or dither:16, can be given many times "
+        "and all of them are applied in order in one pass")
+@click.option('--to-sample-rate', default=None, type=click.IntRange(min=1),
+        help="Sample rate in Hz to resample --in-file to")
+@click.option('--to-channels', default=None, type=click.IntRange(min=1), help="Number of channels to mix --in-file to")
+@click.option('--mix', 'mix_rows', multiple=True,
+        help="Comma separated gains of every --in-file channel for one output channel, given once per output "
+        "channel, defaults to a standard up or down mix")
+@click.option('-j', '--jobs', default=1, help="Number of worker processes used to transform the file")
+@click.option('--profile', is_flag=True, help="Print the time spent reading, decoding, transforming, encoding "
+        "and writing to stderr")
+@click.option('--profile-output', default=None, help="Write cProfile stats of the whole run to this file")
 @click.argument('out_filename', required=True)
-def main(nrc_file, nlc_file, wave_type, frequency, out_filename):
+def convert(nrc_file, nlc_file, wave_type, frequency, sample_rate, bits, channels, duration, in_file, operations,
+        to_sample_rate, to_channels, mix_rows, jobs, profile, profile_output, out_filename):
     """Wave file utility program that will allow you to do one of several
     commands at a time. You can remove the right channel data from stereo
-    wav file, remove the left, or generate a whole new wav file that
-    contains a signal with a certain waveform and frequency.
+    wav file, remove the left, apply a chain of operations to a wav file,
+    resample it or mix it to another number of channels, or generate a
+    whole new wav file that contains a signal with a certain waveform and
+    frequency. Generated wav files can be written to stdout by passing - as
+    OUT_FILENAME.
     """
-    if nrc_file is not None:
+    metrics = ProcessingMetrics() if profile else None
+    if profile_output is not None:
+        start_profiler(profile_output)
+    is_conversion = to_sample_rate is not None or to_channels is not None or mix_rows
+    if operations or is_conversion:
+        if in_file is None:
+            raise click.UsageError("--operation, --to-sample-rate, --to-channels and --mix need an --in-file")
+        in_wav_file = WavFile.open_existing(in_file)
+        try:
+            pipeline = parse_pipeline(operations, in_wav_file) if operations else None
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--operation')
+        if is_conversion:
+            try:
+                mix_matrix = [[float(gain) for gain in row.split(',')] for row in mix_rows] or None
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint='--mix')
+            if mix_matrix is not None:
+                src_num_channels = in_wav_file.meta_data.format_chunk_num_channels
+                if any(len(row) != src_num_channels for row in mix_matrix):
+                    raise click.BadParameter("Every mix needs %d gains" % src_num_channels, param_hint='--mix')
+                to_channels = len(mix_matrix)
+            dest_wav_file = WavFile.create_new_wav_file_with_conversion(in_wav_file, out_filename,
+                    sample_rate=to_sample_rate, num_channels=to_channels, mix_matrix=mix_matrix,
+                    block_trans_func=pipeline, metrics=metrics)
+            click.echo("Converted %s to %d Hz with %d channels and output to %s" % (in_file,
+                    dest_wav_file.meta_data.format_chunk_sample_rate,
+                    dest_wav_file.meta_data.format_chunk_num_channels, out_filename))
+        else:
+            WavFile.create_new_wav_file_with_transformation(in_wav_file, out_filename,
+                    block_trans_func=pipeline, workers=jobs, metrics=metrics)
+            click.echo("Applied %s to %s and output to %s" % (' -> '.join(operations), in_file, out_filename))
+    elif nrc_file is not None:
         in_wav_file = WavFile.open_existing(nrc_file)
-        WavFile.create_new_wav_file_with_transformation(in_wav_file, out_filename, remove_right_channel)
+        try:
+            check_block_transform('no-right-channel', in_wav_file)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--no-right-channel')
+        WavFile.create_new_wav_file_with_transformation(in_wav_file, out_filename,
+                block_trans_func=remove_right_channel_block, workers=jobs, metrics=metrics)
         click.echo("Removed right channel from %s and output to %s" % (nrc_file, out_filename))
     elif nlc_file is not None:
         in_wav_file = WavFile.open_existing(nlc_file)
-        WavFile.create_new_wav_file_with_transformation(in_wav_file, out_filename, remove_left_channel)
+        try:
+            check_block_transform('no-left-channel', in_wav_file)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint='--no-left-channel')
+        WavFile.create_new_wav_file_with_transformation(in_wav_file, out_filename,
+                block_trans_func=remove_left_channel_block, workers=jobs, metrics=metrics)
         click.echo("Removed left channel from %s and output to %s" % (nlc_file, out_filename))
     elif wave_type is not None:
-        WavFile.create_new_wav_file_with_wave_form(out_filename, wave_forms_by_name[wave_type](frequency))
-        click.echo("Generated wave form %s at %d Hz and output to %s" % (wave_type, frequency, out_filename))
+        WavFile.create_new_wav_file_with_wave_form(out_filename, wave_forms_by_name[wave_type](frequency),
+                sample_rate=sample_rate, bits_per_sample=int(bits), num_channels=channels,
+                duration_seconds=None if math.isinf(duration) else duration, metrics=metrics)
+        # Keep stdout clean when the wav file itself is written there
+        click.echo("Generated wave form %s at %d Hz and output to %s" % (wave_type, frequency, out_filename),
+                err=out_filename == '-')
     else:
         click.echo("No options passed!")
-        with click.Context(main) as ctx:
-            click.echo(main.get_help(ctx))
+        with click.Context(convert) as ctx:
+            click.echo(convert.get_help(ctx))
+        return
+    if metrics is not None:
+        click.echo(metrics.get_report(), err=True)
+
+
+@main.command()
+@click.argument('inputs', nargs=-1)
+@click.option('-m', '--manifest', type=click.File('r'), default=None, help="File listing one input wav file per line")
+@click.option('-o', '--output-dir', required=True)
+@click.option('-p', '--operation', type=click.Choice(list(block_transforms_by_name.keys())), default=None)
+@click.option('-w', '--wave-type', type=click.Choice(list(wave_forms_by_name.keys())), default=None)
+@click.option('-f', '--frequency', 'frequencies', type=int, multiple=True,
+        help="Frequency of a wav file to generate, can be given many times")
+@click.option('-j', '--jobs', default=os.cpu_count(), help="Number of files processed at the same time")
+@click.option('--force', is_flag=True, help="Process files even if their output is up to date")
+def batch(inputs, manifest, output_dir, operation, wave_type, frequencies, jobs, force):
+    """Apply an operation to every wav file in the INPUTS directories, glob
+    patterns and files, writing the results to the output directory, or
+    generate one wav file per frequency with a wave type. Files are processed
+    concurrently and outputs that are already up to date are skipped.
+    """
+    tasks = []
+    if operation is not None:
+        if manifest is not None:
+            inputs += tuple(wav_batch.read_manifest(manifest))
+        for src_filename, dest_filename in wav_batch.find_wav_files(inputs, output_dir):
+            tasks.append((src_filename, dest_filename, wav_batch.transform_file,
+                    (operation, src_filename, dest_filename)))
+    elif wave_type is not None:
+        for frequency in frequencies:
+            dest_filename = os.path.join(output_dir, "%s_%dHz.wav" % (wave_type, frequency))
+            tasks.append((None, dest_filename, wav_batch.generate_file, (wave_type, frequency, dest_filename)))
+    else:
+        raise click.UsageError("One of --operation or --wave-type is required")
+    summary = wav_batch.run_batch(tasks, workers=jobs, force=force)
+    for filename, error in summary.failures:
+        click.echo("Failed %s: %s" % (filename, error), err=True)
+    click.echo("Processed %d files, skipped %d up to date, %d failed in %.2f s (%.1f files/s, %.1f MB/s)" %
+            (summary.num_processed, summary.num_skipped, len(summary.failures), summary.elapsed_seconds,
+            summary.get_files_per_second(), summary.get_megabytes_per_second()))
+
+
+@main.command()
+@click.argument('filenames', nargs=-1, required=True)
+@click.option('-s', '--silence-threshold', default=-60.0, help="Level in dBFS at or below which a sample is silent")
+def analyze(filenames, silence_threshold):
+    """Print JSON with the peak, RMS, DC offset, clipping and silence of every
+    channel of each wav file, reading each file once.
+    """
+    results = [WavFile.open_existing(filename).analyze(silence_threshold) for filename in filenames]
+    click.echo(json.dumps(results[0] if len(results) == 1 else results, indent=2))
+
 
+@main.command()
+@click.argument('inputs', nargs=-1, required=True)
+@click.option('-x', '--index', 'index_filename', default=library_index.INDEX_FILENAME_DEFAULT,
+        help="SQLite file that holds the index")
+@click.option('-j', '--jobs', default=32, help="Number of headers read at the same time")
+def scan(inputs, index_filename, jobs):
+    """Index the headers of every wav file in the INPUTS directories, glob
+    patterns and files. Only files that changed since the last scan are read
+    and files that fail to parse are recorded with their error.
+    """
+    with library_index.LibraryIndex(index_filename) as index:
+        summary = index.scan(inputs, workers=jobs)
+    for filename, error in summary.errors:
+        click.echo("Failed %s: %s" % (filename, error), err=True)
+    click.echo("Indexed %d files, read %d, %d unchanged, removed %d, %d failed in %.2f s (%.1f files/s)" %
+            (summary.num_files, summary.num_read, summary.num_unchanged, summary.num_removed, len(summary.errors),
+            summary.elapsed_seconds, summary.get_files_per_second()))
+
+
+@main.command()
+@click.option('-x', '--index', 'index_filename', default=library_index.INDEX_FILENAME_DEFAULT,
+        help="SQLite file that holds the index")
+@click.option('--bits', type=int, default=None, help="Only files with this many bits per sample")
+@click.option('--channels', type=int, default=None, help="Only files with this many channels")
+@click.option('--sample-rate', type=int, default=None, help="Only files with this sample rate in Hz")
+@click.option('--min-duration', type=float, default=None, help="Only files at least this many seconds long")
+@click.option('--max-duration', type=float, default=None, help="Only files at most this many seconds long")
+@click.option('--errors', 'include_errors', is_flag=True, help="Also list files that failed to parse")
+@click.option('--json', 'as_json', is_flag=True, help="Print the matching rows as JSON")
+def query(index_filename, bits, channels, sample_rate, min_duration, max_duration, include_errors, as_json):
+    """List the indexed wav files that match every given condition, without
+    opening any of them.
+    """
+    with library_index.LibraryIndex(index_filename) as index:
+        rows = index.query(bits_per_sample=bits, num_channels=channels, sample_rate=sample_rate,
+                min_duration_seconds=min_duration, max_duration_seconds=max_duration,
+                include_errors=include_errors)
+    if as_json:
+        click.echo(json.dumps(rows, indent=2))
+        return
+    for row in rows:
+        if row['error'] is not None:
+            click.echo("%s  error: %s" % (row['path'], ' '.join(row['error'].split())))
+        else:
+            click.echo("%s  %d Hz %d bit %d ch %.2f s" % (row['path'], row['sample_rate'], row['bits_per_sample'],
+                    row['num_channels'], row['duration_seconds']))
+
+
+@main.command(name='peaks')
+@click.argument('filenames', nargs=-1, required=True)
+@click.option('-b', '--frames-per-bin', default=peaks.FRAMES_PER_BIN_DEFAULT,
+        help="Frames summarized by each bin of the finest zoom level")
+@click.option('-z', '--zoom-factor', default=peaks.ZOOM_FACTOR_DEFAULT,
+        help="How many bins of a level make up one bin of the next coarser level")
+@click.option('--force', is_flag=True, help="Build the sidecars from scratch even if they are up to date")
+def build_peaks(filenames, frames_per_bin, zoom_factor, force):
+    """Build or update the .peak sidecar of each wav file, which holds the
+    min, max and RMS of every channel at several zoom levels for drawing
+    waveforms. Files that only grew since their sidecar was built are read
+    from where it left off.
+    """
+    for filename in filenames:
+        status = peaks.update_peak_file(filename, frames_per_bin, zoom_factor, force)
+        click.echo("%s: %s" % (peaks.get_peak_filename(filename), status))
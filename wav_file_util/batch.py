@@ -0,0 +1,171 @@
+"""Module that applies one operation to many wav files at a time using a pool
+of worker processes.
+
+"""
+
+import os
+import glob
+import time
+import concurrent.futures
+
+from wav_file_util.wav_file import WavFile
+from wav_file_util.transforms import block_transforms_by_name, check_block_transform
+from wav_file_util.generation import wave_forms_by_name
+
+
+class BatchSummary:
+    """The counts and timing of a finished batch run that are used to report
+    its throughput.
+
+    """
+
+    def __init__(self):
+        self.num_processed = 0
+        self.num_skipped = 0
+        self.failures = []
+        self.num_bytes = 0
+        self.elapsed_seconds = 0.0
+
+    def get_files_per_second(self):
+        return self.num_processed / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+    def get_megabytes_per_second(self):
+        return self.num_bytes / 1e6 / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def find_wav_files(inputs, output_dir):
+    """Returns a list of (src_filename, dest_filename) tuples for every wav file
+    named by inputs. An input can be a directory, which is searched recursively
+    for files ending in .wav in any case, or a glob pattern, and the layout of
+    the files under the directory or the part of the pattern before its first
+    wildcard is kept under output_dir, or a filename.
+    """
+    file_pairs = []
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            filenames = glob.glob(os.path.join(input_path, '**', '*'), recursive=True)
+            for src_filename in sorted(filename for filename in filenames
+                    if is_wav_filename(filename) and os.path.isfile(filename)):
+                dest_filename = os.path.join(output_dir, os.path.relpath(src_filename, input_path))
+                file_pairs.append((src_filename, dest_filename))
+        elif glob.has_magic(input_path):
+            base_dir = get_glob_base_dir(input_path)
+            for src_filename in sorted(glob.glob(input_path, recursive=True)):
+                dest_filename = os.path.join(output_dir, os.path.relpath(src_filename, base_dir))
+                file_pairs.append((src_filename, dest_filename))
+        else:
+            file_pairs.append((input_path, os.path.join(output_dir, os.path.basename(input_path))))
+    return file_pairs
+
+
+def is_wav_filename(filename):
+    """Returns True if filename ends in .wav in any case, e.g. the .WAV of many
+    field recorders.
+    """
+    return os.path.splitext(filename)[1].lower() == '.wav'
+
+
+def get_glob_base_dir(pattern):
+    """Returns the directory made of the components of pattern before the first
+    one with a wildcard in it, e.g. in for in/*/*.wav.
+    """
+    base_components = []
+    for component in os.path.dirname(pattern).split(os.sep):
+        if glob.has_magic(component):
+            break
+        base_components.append(component)
+    return os.sep.join(base_components) or os.curdir
+
+
+def read_manifest(manifest_file):
+    """Returns the filenames listed one per line in manifest_file, skipping
+    blank lines and lines starting with #.
+    """
+    filenames = []
+    for line in manifest_file:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            filenames.append(line)
+    return filenames
+
+
+def is_up_to_date(src_filename, dest_filename):
+    """Returns True if dest_filename exists and was modified after src_filename,
+    or for generated files where there is no src_filename, if it exists at all.
+    """
+    if not os.path.exists(dest_filename):
+        return False
+    return src_filename is None or os.path.getmtime(dest_filename) >= os.path.getmtime(src_filename)
+
+
+def write_replacing(dest_filename, write_func):
+    """Calls write_func with a temporary filename next to dest_filename and
+    renames the file it writes over dest_filename once it returns. If it raises
+    the temporary file is removed, so a failed task never leaves a partial
+    dest_filename that is_up_to_date would take for finished output.
+    """
+    os.makedirs(os.path.dirname(dest_filename) or '.', exist_ok=True)
+    temp_filename = dest_filename + '.tmp'
+    try:
+        write_func(temp_filename)
+        os.replace(temp_filename, dest_filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def transform_file(operation, src_filename, dest_filename):
+    """Worker process entry point that applies the named block transformation
+    to src_filename and returns the number of bytes read.
+    """
+    src_wav_file = WavFile.open_existing(src_filename)
+    check_block_transform(operation, src_wav_file)
+    write_replacing(dest_filename, lambda filename: WavFile.create_new_wav_file_with_transformation(src_wav_file,
+            filename, block_trans_func=block_transforms_by_name[operation]))
+    return os.path.getsize(src_filename)
+
+
+def generate_file(wave_type, frequency, dest_filename):
+    """Worker process entry point that generates a wav file with the named wave
+    form and returns the number of bytes written.
+    """
+    write_replacing(dest_filename, lambda filename: WavFile.create_new_wav_file_with_wave_form(filename,
+            wave_forms_by_name[wave_type](frequency)))
+    return os.path.getsize(dest_filename)
+
+
+def run_batch(tasks, workers=None, force=False):
+    """Runs tasks, a list of (src_filename, dest_filename, func, args) tuples
+    where func(*args) does the work for one file and returns the number of bytes
+    it processed, across workers processes. src_filename is None for generated
+    files. Tasks whose output is up to date are skipped unless force is True,
+    and tasks that would write the same dest_filename as an earlier task fail
+    instead of overwriting its output. Returns a BatchSummary.
+    """
+    summary = BatchSummary()
+    start_time = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        # dest filename: name of the task that writes it
+        task_names_by_dest_filename = {}
+        for src_filename, dest_filename, func, args in tasks:
+            task_name = src_filename or dest_filename
+            dest_key = os.path.normcase(os.path.abspath(dest_filename))
+            if dest_key in task_names_by_dest_filename:
+                summary.failures.append((task_name, ValueError("Output %s is also written for %s" %
+                        (dest_filename, task_names_by_dest_filename[dest_key]))))
+                continue
+            task_names_by_dest_filename[dest_key] = task_name
+            if not force and is_up_to_date(src_filename, dest_filename):
+                summary.num_skipped += 1
+                continue
+            futures[executor.submit(func, *args)] = task_name
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                summary.num_bytes += future.result()
+                summary.num_processed += 1
+            except Exception as e:
+                summary.failures.append((futures[future], e))
+    summary.elapsed_seconds = time.perf_counter() - start_time
+    return summary
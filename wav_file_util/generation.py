@@ -4,17 +4,60 @@
 
 import math
 
+import numpy as np
+
+from wav_file_util.wavetable import WavetableOscillator
 
 
 class WaveForm:
+    """Base class of wave forms whose y values are in the range [0,1] and repeat
+    every 2 pi of x. Subclasses that set wavetable_name to one of the names in
+    wavetable.harmonics_by_wavetable_name are rendered from band limited tables,
+    otherwise render evaluates y_from_x_array.
+
+    """
+
+    wavetable_name = None
 
     def __init__(self, frequency):
         self.frequency = frequency
 
+    def render(self, start_frame, num_frames, sample_rate):
+        """Returns the y values of num_frames frames starting at start_frame when
+        played back at sample_rate. Frames are rendered from their index alone so
+        any range can be rendered in any order.
+        """
+        phases = self.get_phases(start_frame, num_frames, sample_rate)
+        if self.wavetable_name is None:
+            return self.y_from_x_array(phases * 2 * math.pi)
+        oscillator = WavetableOscillator(self.wavetable_name, sample_rate)
+        y = oscillator.lookup(phases, self.get_frequencies(start_frame, num_frames, sample_rate))
+        # shift up to range [0,1]
+        return y / 2 + 1/2
+
+    def get_phases(self, start_frame, num_frames, sample_rate):
+        """Returns how many periods of the wave form have passed at each frame.
+        """
+        return np.arange(start_frame, start_frame + num_frames) * (self.frequency / sample_rate)
+
+    def get_frequencies(self, start_frame, num_frames, sample_rate):
+        """Returns the frequency at each frame, or one frequency for all of them.
+        """
+        return self.frequency
+
     def y_from_x(self, x):
         assert False, "Not implemented"
 
+    def y_from_x_array(self, x):
+        """Returns y_from_x evaluated for every value in the numpy array x.
+        Subclasses should override this with a vectorized version as this
+        default calls y_from_x once per value.
+        """
+        return np.frompyfunc(self.y_from_x, 1, 1)(x).astype(np.float64)
+
 class SquareWaveForm(WaveForm):
+
+    wavetable_name = 'square'
     
     def __init__(self, frequency):
         WaveForm.__init__(self, frequency)
@@ -26,8 +69,13 @@ class SquareWaveForm(WaveForm):
         else:
             return 1
 
+    def y_from_x_array(self, x):
+        return np.where(np.sin(x) < 0, 0.0, 1.0)
+
 class SineWaveForm(WaveForm):
 
+    wavetable_name = 'sine'
+
     def __init__(self, frequency):
         WaveForm.__init__(self, frequency)
 
@@ -36,13 +84,66 @@ class SineWaveForm(WaveForm):
         # shift up to range [0,1]
         return y / 2 + 1/2
 
+    def y_from_x_array(self, x):
+        y = np.sin(x)
+        # shift up to range [0,1]
+        return y / 2 + 1/2
+
 class SawtoothWaveForm(WaveForm):
 
+    wavetable_name = 'sawtooth'
+
     def __init__(self, frequency):
         WaveForm.__init__(self, frequency)
 
     def y_from_x(self, x):
-        return x - int(x)
+        periods = x / (2 * math.pi)
+        return periods - math.floor(periods)
+
+    def y_from_x_array(self, x):
+        periods = x / (2 * math.pi)
+        return periods - np.floor(periods)
+
+class SweepWaveForm(WaveForm):
+    """Wave form whose frequency rises or falls exponentially from start_frequency
+    to end_frequency over duration_seconds and then stays at end_frequency.
+
+    """
+
+    def __init__(self, start_frequency, end_frequency, duration_seconds, wavetable_name='sine'):
+        WaveForm.__init__(self, start_frequency)
+        self.end_frequency = end_frequency
+        self.duration_seconds = duration_seconds
+        self.wavetable_name = wavetable_name
+
+    def get_phases(self, start_frame, num_frames, sample_rate):
+        seconds = np.arange(start_frame, start_frame + num_frames) / sample_rate
+        sweep_seconds = np.minimum(seconds, self.duration_seconds)
+        rate = math.log(self.end_frequency / self.frequency) / self.duration_seconds
+        if rate == 0:
+            return seconds * self.frequency
+        # Integral of the frequency frequency * e^(rate * t) up to the end of the sweep
+        phases = self.frequency * np.expm1(rate * sweep_seconds) / rate
+        return phases + (seconds - sweep_seconds) * self.end_frequency
+
+    def get_frequencies(self, start_frame, num_frames, sample_rate):
+        seconds = np.minimum(np.arange(start_frame, start_frame + num_frames) / sample_rate, self.duration_seconds)
+        return self.frequency * (self.end_frequency / self.frequency) ** (seconds / self.duration_seconds)
+
+class MultiToneWaveForm(WaveForm):
+    """Wave form that is the average of one wave form of each of frequencies.
+
+    """
+
+    def __init__(self, frequencies, wavetable_name='sine'):
+        WaveForm.__init__(self, frequencies[0])
+        self.wave_forms = [WaveForm(frequency) for frequency in frequencies]
+        for wave_form in self.wave_forms:
+            wave_form.wavetable_name = wavetable_name
+
+    def render(self, start_frame, num_frames, sample_rate):
+        return sum(wave_form.render(start_frame, num_frames, sample_rate)
+                for wave_form in self.wave_forms) / len(self.wave_forms)
 
 
 wave_forms_by_name = {
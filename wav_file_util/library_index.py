@@ -0,0 +1,207 @@
+"""Module that keeps a SQLite index of the headers of a library of wav files so
+it can be listed and queried without opening every file again.
+
+"""
+
+import os
+import json
+import time
+import sqlite3
+import concurrent.futures
+
+from wav_file_util.wav_file import WavFile, WavChunk
+from wav_file_util import batch as wav_batch
+
+
+INDEX_FILENAME_DEFAULT = 'wav_library.sqlite'
+
+# Bumped whenever the columns change, an index with another version is rebuilt
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS wav_files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT,
+    super_chunk_id INTEGER,
+    audio_format INTEGER,
+    sample_rate INTEGER,
+    bits_per_sample INTEGER,
+    num_channels INTEGER,
+    data_offset INTEGER,
+    data_chunk_size INTEGER,
+    num_frames INTEGER,
+    duration_seconds REAL,
+    meta_data_bytes BLOB,
+    chunks TEXT
+);
+CREATE INDEX IF NOT EXISTS wav_files_format ON wav_files (bits_per_sample, num_channels, duration_seconds);
+"""
+
+# Columns returned by queries, meta_data_bytes and chunks are only used to rebuild WavFile objects
+QUERY_COLUMNS = ('path', 'size', 'mtime_ns', 'error', 'sample_rate', 'bits_per_sample', 'num_channels',
+        'num_frames', 'duration_seconds')
+
+
+class ScanSummary:
+    """The counts and timing of a finished scan of a library.
+
+    """
+
+    def __init__(self):
+        self.num_files = 0
+        self.num_unchanged = 0
+        self.num_read = 0
+        self.num_removed = 0
+        self.errors = []
+        self.elapsed_seconds = 0.0
+
+    def get_files_per_second(self):
+        return self.num_files / self.elapsed_seconds if self.elapsed_seconds else 0.0
+
+
+def read_header(filename, stat_result):
+    """Worker thread entry point that reads the header of filename and returns
+    the row to store for it. Files that fail to parse or validate get a row
+    with their error instead of raising so one bad file does not stop a scan.
+    """
+    row = {'path': filename, 'size': stat_result.st_size, 'mtime_ns': stat_result.st_mtime_ns, 'error': None}
+    try:
+        wav_file = WavFile.open_existing(filename)
+        meta_data = wav_file.meta_data
+        row.update({
+            'super_chunk_id': meta_data.super_chunk_id,
+            'audio_format': meta_data.format_chunk_audio_format,
+            'sample_rate': meta_data.format_chunk_sample_rate,
+            'bits_per_sample': meta_data.format_chunk_bits_per_sample,
+            'num_channels': meta_data.format_chunk_num_channels,
+            'data_offset': wav_file._get_data_offset(),
+            'data_chunk_size': meta_data.data_chunk_size,
+            'num_frames': wav_file._get_num_frames(),
+            'duration_seconds': wav_file._get_num_frames() / meta_data.format_chunk_sample_rate,
+            'meta_data_bytes': wav_file.meta_data_bytes,
+            'chunks': json.dumps([[chunk.chunk_id, chunk.offset, chunk.size] for chunk in wav_file.chunks])
+        })
+    except Exception as e:
+        row['error'] = str(e) or type(e).__name__
+    return row
+
+
+class LibraryIndex:
+    """A SQLite database at db_filename with one row per wav file holding its
+    size and modification time, the parsed fields of its header, the raw header
+    bytes and its chunk offsets, or the error it failed with.
+
+    """
+
+    def __init__(self, db_filename=INDEX_FILENAME_DEFAULT):
+        self.db_filename = db_filename
+        self.connection = sqlite3.connect(db_filename)
+        self.connection.row_factory = sqlite3.Row
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.connection.execute('DROP TABLE IF EXISTS wav_files')
+            self.connection.execute('PRAGMA user_version = %d' % SCHEMA_VERSION)
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def scan(self, inputs, workers=None):
+        """Brings the index up to date with every wav file named by inputs, which
+        are directories, glob patterns or filenames as taken by batch. Only files
+        whose size or modification time changed since they were last indexed are
+        read, by workers threads at a time, and rows of files that no longer
+        exist are removed. Returns a ScanSummary.
+        """
+        summary = ScanSummary()
+        start_time = time.perf_counter()
+        filenames = sorted(set(os.path.abspath(src_filename)
+                for src_filename, _ in wav_batch.find_wav_files(inputs, '')))
+        indexed = {row['path']: (row['size'], row['mtime_ns'])
+                for row in self.connection.execute('SELECT path, size, mtime_ns FROM wav_files')}
+        rows = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for filename in filenames:
+                try:
+                    stat_result = os.stat(filename)
+                except OSError as e:
+                    summary.errors.append((filename, str(e)))
+                    continue
+                summary.num_files += 1
+                if indexed.get(filename) == (stat_result.st_size, stat_result.st_mtime_ns):
+                    summary.num_unchanged += 1
+                    continue
+                futures.append(executor.submit(read_header, filename, stat_result))
+            for future in futures:
+                row = future.result()
+                rows.append(row)
+                if row['error'] is not None:
+                    summary.errors.append((row['path'], row['error']))
+        missing_filenames = [(filename,) for filename in indexed if not os.path.exists(filename)]
+        with self.connection:
+            for row in rows:
+                self._store_row(row)
+            self.connection.executemany('DELETE FROM wav_files WHERE path = ?', missing_filenames)
+        summary.num_read = len(rows)
+        summary.num_removed = len(missing_filenames)
+        summary.elapsed_seconds = time.perf_counter() - start_time
+        return summary
+
+    def query(self, bits_per_sample=None, num_channels=None, sample_rate=None, min_duration_seconds=None,
+            max_duration_seconds=None, include_errors=False):
+        """Returns a list of dicts with the QUERY_COLUMNS of every indexed file,
+        ordered by path, that matches all of the conditions that are not None.
+        Files that failed to parse only match if include_errors is True and no
+        format conditions are given.
+        """
+        conditions = []
+        params = []
+        for column, value in (('bits_per_sample', bits_per_sample), ('num_channels', num_channels),
+                ('sample_rate', sample_rate)):
+            if value is not None:
+                conditions.append('%s = ?' % column)
+                params.append(value)
+        if min_duration_seconds is not None:
+            conditions.append('duration_seconds >= ?')
+            params.append(min_duration_seconds)
+        if max_duration_seconds is not None:
+            conditions.append('duration_seconds <= ?')
+            params.append(max_duration_seconds)
+        if not include_errors:
+            conditions.append('error IS NULL')
+        sql = 'SELECT %s FROM wav_files' % ', '.join(QUERY_COLUMNS)
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        return [dict(row) for row in self.connection.execute(sql + ' ORDER BY path', params)]
+
+    def open_wav_file(self, filename):
+        """Returns a WavFile for filename built from its row in the index if the
+        file has not changed since it was indexed, without reading it, and
+        otherwise opens it from disk and updates its row.
+        """
+        filename = os.path.abspath(filename)
+        stat_result = os.stat(filename)
+        row = self.connection.execute('SELECT * FROM wav_files WHERE path = ?', (filename,)).fetchone()
+        if row is None or row['error'] is not None or \
+                (row['size'], row['mtime_ns']) != (stat_result.st_size, stat_result.st_mtime_ns):
+            wav_file = WavFile.open_existing(filename)
+            with self.connection:
+                self._store_row(read_header(filename, stat_result))
+            return wav_file
+        wav_file = WavFile(filename)
+        wav_file.chunks = [WavChunk(*chunk) for chunk in json.loads(row['chunks'])]
+        wav_file.meta_data_bytes = bytes(row['meta_data_bytes'])
+        wav_file.meta_data = wav_file._parse_meta_data(wav_file.meta_data_bytes)
+        return wav_file
+
+    def _store_row(self, row):
+        self.connection.execute('INSERT OR REPLACE INTO wav_files (%s) VALUES (%s)' % (', '.join(row.keys()),
+                ', '.join('?' * len(row))), list(row.values()))
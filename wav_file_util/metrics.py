@@ -0,0 +1,124 @@
+"""Module that contains the metrics object WavFile operations fill in when they
+are given one, to see where the time of a slow job goes.
+
+"""
+
+import time
+import contextlib
+
+
+# Stages of the block loop in the order they happen
+STAGES = ('read', 'generate', 'decode', 'transform', 'encode', 'write')
+
+
+class ProcessingMetrics:
+    """Per stage seconds and the bytes, samples and blocks processed by a WavFile
+    operation. If callback is given it is called with this object after every
+    block, e.g. to report progress. Parallel operations sum the stage seconds of
+    their workers, so those can add up to more than elapsed_seconds, and only
+    call callback once per finished worker.
+
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stage_seconds = {}
+        self.num_blocks = 0
+        self.num_samples = 0
+        self.num_bytes_read = 0
+        self.num_bytes_written = 0
+        self.elapsed_seconds = 0.0
+        self._start_time = None
+
+    def add_time(self, stage, start_time):
+        """Adds the time from start_time, a time.perf_counter() value, until now
+        to stage.
+        """
+        self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + time.perf_counter() - start_time
+
+    def time_stage(self, stage):
+        """Returns a context manager that adds the time spent in its block to
+        stage.
+        """
+        return _StageTimer(self, stage)
+
+    def end_block(self):
+        self.num_blocks += 1
+        if self.callback is not None:
+            self.callback(self)
+
+    def start(self):
+        self._start_time = time.perf_counter()
+
+    def stop(self):
+        self.elapsed_seconds += time.perf_counter() - self._start_time
+
+    def merge(self, other):
+        """Adds the counts and stage seconds of other, the metrics of a worker,
+        to this object.
+        """
+        for stage, seconds in other.stage_seconds.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+        self.num_blocks += other.num_blocks
+        self.num_samples += other.num_samples
+        self.num_bytes_read += other.num_bytes_read
+        self.num_bytes_written += other.num_bytes_written
+        if self.callback is not None:
+            self.callback(self)
+
+    def to_dict(self):
+        return {
+            'stage_seconds': dict(self.stage_seconds),
+            'num_blocks': self.num_blocks,
+            'num_samples': self.num_samples,
+            'num_bytes_read': self.num_bytes_read,
+            'num_bytes_written': self.num_bytes_written,
+            'elapsed_seconds': self.elapsed_seconds
+        }
+
+    def get_report(self):
+        """Returns a table of the seconds and share of the total of every stage
+        followed by the totals and throughput.
+        """
+        stages = [stage for stage in STAGES if stage in self.stage_seconds] + \
+                sorted(stage for stage in self.stage_seconds if stage not in STAGES)
+        total_stage_seconds = sum(self.stage_seconds.values())
+        lines = ["%-12s %10s %7s" % ('stage', 'seconds', 'share')]
+        for stage in stages:
+            seconds = self.stage_seconds[stage]
+            lines.append("%-12s %10.4f %6.1f%%" % (stage, seconds,
+                    100 * seconds / total_stage_seconds if total_stage_seconds else 0.0))
+        lines.append("%-12s %10.4f" % ('elapsed', self.elapsed_seconds))
+        samples_per_second = self.num_samples / self.elapsed_seconds if self.elapsed_seconds else 0.0
+        lines.append("%d blocks, %d samples (%.0f samples/s), read %.1f MB, wrote %.1f MB" % (self.num_blocks,
+                self.num_samples, samples_per_second, self.num_bytes_read / 1e6, self.num_bytes_written / 1e6))
+        return '\n'.join(lines)
+
+
+class _StageTimer:
+    """Context manager returned by ProcessingMetrics.time_stage.
+
+    """
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+        self.start_time = None
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.add_time(self.stage, self.start_time)
+
+
+# Shared by every untimed block, it has no state
+_NULL_TIMER = contextlib.nullcontext()
+
+
+def time_stage(metrics, stage):
+    """Returns metrics.time_stage(stage), or if metrics is None a context
+    manager that does nothing, so code that is not being measured never reads
+    the clock.
+    """
+    return _NULL_TIMER if metrics is None else metrics.time_stage(stage)
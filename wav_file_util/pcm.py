@@ -0,0 +1,66 @@
+"""Module that converts between raw PCM bytes and frames x channels integer arrays.
+
+"""
+
+import numpy as np
+
+
+def get_sample_value_range(bits_per_sample):
+    """Returns the (min, max) signed integer values a sample with bits_per_sample
+    bits can hold once decoded.
+    """
+    return -(1 << (bits_per_sample - 1)), (1 << (bits_per_sample - 1)) - 1
+
+
+def decode_samples(raw, bits_per_sample):
+    """Decodes a uint8 array whose last axis holds the little endian bytes of
+    one sample into an int32 array of signed sample values with that last axis
+    removed. 8 bit samples are stored unsigned in wav files so they are shifted
+    to be centered around 0 like every other bit depth.
+    """
+    bytes_per_sample = bits_per_sample // 8
+    assert raw.shape[-1] == bytes_per_sample, "Last axis must hold the bytes of one sample"
+    if bytes_per_sample == 1:
+        return raw[..., 0].astype(np.int32) - 128
+    if bytes_per_sample in (2, 4):
+        dtype = np.dtype('<i%d' % bytes_per_sample)
+        return np.ascontiguousarray(raw).view(dtype)[..., 0].astype(np.int32)
+    if bytes_per_sample == 3:
+        samples = raw[..., 0].astype(np.int32)
+        samples |= raw[..., 1].astype(np.int32) << 8
+        samples |= raw[..., 2].astype(np.int32) << 16
+        # Sign extend from 24 to 32 bits
+        return (samples << 8) >> 8
+    assert False, "Unsupported bits per sample: %d" % bits_per_sample
+
+
+def decode_frames(data, num_channels, bits_per_sample):
+    """Decodes interleaved PCM bytes into a frames x channels int32 array. Any
+    trailing bytes that do not make up a whole frame are ignored.
+    """
+    bytes_per_sample = bits_per_sample // 8
+    bytes_per_frame = bytes_per_sample * num_channels
+    num_frames = len(data) // bytes_per_frame
+    raw = np.frombuffer(data, dtype=np.uint8, count=num_frames * bytes_per_frame)
+    return decode_samples(raw.reshape(num_frames, num_channels, bytes_per_sample), bits_per_sample)
+
+
+def encode_frames(frames, bits_per_sample, out=None):
+    """Encodes a frames x channels integer array into interleaved little endian
+    PCM bytes. Values outside of the range of the bit depth are clipped. If out
+    is given it must be a writable buffer of exactly the right size and the
+    bytes are written into it instead of a newly allocated bytes object.
+    """
+    bytes_per_sample = bits_per_sample // 8
+    min_value, max_value = get_sample_value_range(bits_per_sample)
+    samples = np.clip(np.asarray(frames), min_value, max_value).astype('<i4')
+    if bytes_per_sample == 1:
+        samples += 128
+    encoded = samples.reshape(samples.shape + (1,)).view(np.uint8)[..., :bytes_per_sample]
+    if out is None:
+        return encoded.tobytes()
+    out_array = np.frombuffer(out, dtype=np.uint8)
+    assert out_array.size == encoded.size, "Output buffer is %d bytes but %d are needed" % \
+            (out_array.size, encoded.size)
+    out_array.reshape(encoded.shape)[...] = encoded
+    return out
@@ -0,0 +1,245 @@
+"""Module that builds and reads .peak sidecar files, which hold the min, max and
+RMS of every channel of a wav file at several zoom levels so waveforms can be
+drawn without reading the samples again.
+
+A sidecar is a little endian header followed by the number of bins of every
+level and then the levels themselves, coarser ones after finer ones, each an
+int16 array of bins x channels x (min, max, RMS) scaled so full scale is 32768.
+Bin i of level n covers frames_per_bin * zoom_factor ** n frames starting at
+frame i times that.
+
+"""
+
+import os
+import mmap
+import struct
+import itertools
+
+import numpy as np
+
+from wav_file_util.wav_file import WavFile
+from wav_file_util import pcm
+
+
+PEAK_FILE_EXTENSION = '.peak'
+PEAK_FILE_MAGIC = b'WPK1'
+PEAK_FILE_VERSION = 1
+# magic, version, source size, source mtime_ns, sample rate, channels, bits per sample, frames per bin of
+#   the finest level, zoom factor between levels, frames covered, number of levels
+PEAK_FILE_HEADER_FORMAT = '<4sIQqIHHIIQI'
+PEAK_FILE_HEADER_SIZE = struct.calcsize(PEAK_FILE_HEADER_FORMAT)
+
+FRAMES_PER_BIN_DEFAULT = 256
+ZOOM_FACTOR_DEFAULT = 4
+
+# Values stored for every bin and channel, in this order
+BIN_FIELDS = ('min', 'max', 'rms')
+PEAK_FULL_SCALE = 32768
+
+
+def get_peak_filename(wav_filename):
+    return wav_filename + PEAK_FILE_EXTENSION
+
+
+class PeakFile:
+    """A read only memory map of a sidecar whose levels are numpy views of the
+    file, so querying a range only touches the pages that hold it.
+
+    """
+
+    def __init__(self, peak_filename, wav_filename=None):
+        self.peak_filename = peak_filename
+        # Used to read samples for zoom levels finer than the sidecar holds
+        self.wav_filename = wav_filename
+        with open(peak_filename, 'rb') as peak_file_obj:
+            self._mmap = mmap.mmap(peak_file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.source_size, self.source_mtime_ns, self.sample_rate, self.num_channels,
+                self.bits_per_sample, self.frames_per_bin, self.zoom_factor, self.num_frames,
+                num_levels) = struct.unpack_from(PEAK_FILE_HEADER_FORMAT, self._mmap)
+        assert magic == PEAK_FILE_MAGIC and version == PEAK_FILE_VERSION, \
+                "%s is not a version %d peak file" % (peak_filename, PEAK_FILE_VERSION)
+        level_num_bins = struct.unpack_from('<%dQ' % num_levels, self._mmap, PEAK_FILE_HEADER_SIZE)
+        offset = PEAK_FILE_HEADER_SIZE + 8 * num_levels
+        # bins x channels x BIN_FIELDS int16 array of every level, finest first
+        self.levels = []
+        for num_bins in level_num_bins:
+            self.levels.append(np.ndarray((num_bins, self.num_channels, len(BIN_FIELDS)), dtype='<i2',
+                    buffer=self._mmap, offset=offset))
+            offset += num_bins * self.num_channels * len(BIN_FIELDS) * 2
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # The numpy views have to be released before the memory map can be closed
+        self.levels = None
+        self._mmap.close()
+
+    def get_level_frames_per_bin(self, level_index):
+        return self.frames_per_bin * self.zoom_factor ** level_index
+
+    def query(self, start_seconds, end_seconds, num_points):
+        """Returns (mins, maxs, rms), num_points x channels float arrays of the
+        levels in [-1, 1] of each of num_points equal parts of the time range,
+        using the coarsest level that still has a bin for every point. Ranges
+        zoomed in further than the finest level are computed from the samples of
+        the wav file if wav_filename was given.
+        """
+        start_frame = max(int(start_seconds * self.sample_rate), 0)
+        end_frame = min(int(end_seconds * self.sample_rate), self.num_frames)
+        if end_frame <= start_frame or num_points <= 0:
+            empty = np.zeros((0, self.num_channels))
+            return empty, empty, empty
+        frames_per_point = (end_frame - start_frame) / num_points
+        if frames_per_point < self.frames_per_bin and self.wav_filename is not None:
+            return self._query_samples(start_frame, end_frame, num_points)
+        level_index = 0
+        while level_index + 1 < len(self.levels) and \
+                self.get_level_frames_per_bin(level_index + 1) <= frames_per_point:
+            level_index += 1
+        level_frames_per_bin = self.get_level_frames_per_bin(level_index)
+        start_bin = start_frame // level_frames_per_bin
+        bins = self.levels[level_index][start_bin:-(-end_frame // level_frames_per_bin)]
+        # Index in bins of the first bin of every point, points share a bin when zoomed in past the level
+        point_frames = start_frame + np.arange(num_points) * (end_frame - start_frame) // num_points
+        point_starts = np.minimum(point_frames // level_frames_per_bin - start_bin, len(bins) - 1)
+        # reduceat gives just the bin at a start that is not before the next start
+        point_sizes = np.maximum(np.diff(np.append(point_starts, len(bins))), 1)
+        mins = np.minimum.reduceat(bins[:, :, 0], point_starts, axis=0) / PEAK_FULL_SCALE
+        maxs = np.maximum.reduceat(bins[:, :, 1], point_starts, axis=0) / PEAK_FULL_SCALE
+        squares = np.square(bins[:, :, 2], dtype=np.float64)
+        rms = np.sqrt(np.add.reduceat(squares, point_starts, axis=0) / point_sizes[:, np.newaxis]) / PEAK_FULL_SCALE
+        return mins, maxs, rms
+
+    def _query_samples(self, start_frame, end_frame, num_points):
+        with WavFile.open_existing(self.wav_filename) as wav_file:
+            frames = wav_file.frames[start_frame:end_frame].astype(np.float64)
+        full_scale = -pcm.get_sample_value_range(self.bits_per_sample)[0]
+        point_starts = np.arange(num_points) * len(frames) // num_points
+        point_sizes = np.maximum(np.diff(np.append(point_starts, len(frames))), 1)
+        mins = np.minimum.reduceat(frames, point_starts, axis=0) / full_scale
+        maxs = np.maximum.reduceat(frames, point_starts, axis=0) / full_scale
+        rms = np.sqrt(np.add.reduceat(np.square(frames), point_starts, axis=0) /
+                point_sizes[:, np.newaxis]) / full_scale
+        return mins, maxs, rms
+
+
+def open_peak_file(wav_filename, frames_per_bin=FRAMES_PER_BIN_DEFAULT, zoom_factor=ZOOM_FACTOR_DEFAULT):
+    """Brings the sidecar of wav_filename up to date with update_peak_file and
+    returns it as a PeakFile.
+    """
+    update_peak_file(wav_filename, frames_per_bin, zoom_factor)
+    return PeakFile(get_peak_filename(wav_filename), wav_filename)
+
+
+def update_peak_file(wav_filename, frames_per_bin=FRAMES_PER_BIN_DEFAULT, zoom_factor=ZOOM_FACTOR_DEFAULT,
+        force=False):
+    """Makes sure the sidecar of wav_filename matches its current size and
+    modification time and returns 'unchanged', 'appended' or 'built'. A wav
+    file that only grew since its sidecar was built, e.g. one that is still
+    being recorded, is assumed to have been appended to, so only its new frames
+    are read. Everything else, or any file if force is True, is read in full.
+    """
+    stat_result = os.stat(wav_filename)
+    wav_file = WavFile.open_existing(wav_filename)
+    meta_data = wav_file.meta_data
+    peak_format = (meta_data.format_chunk_sample_rate, meta_data.format_chunk_num_channels,
+            meta_data.format_chunk_bits_per_sample, frames_per_bin, zoom_factor)
+    num_frames = _get_num_frames_on_disk(wav_file, stat_result.st_size)
+    finest_level = np.zeros((0, meta_data.format_chunk_num_channels, len(BIN_FIELDS)), dtype='<i2')
+    start_frame = 0
+    status = 'built'
+    peak_filename = get_peak_filename(wav_filename)
+    if not force and os.path.exists(peak_filename):
+        with PeakFile(peak_filename) as peak_file:
+            is_same_format = (peak_file.sample_rate, peak_file.num_channels, peak_file.bits_per_sample,
+                    peak_file.frames_per_bin, peak_file.zoom_factor) == peak_format
+            if is_same_format and (peak_file.source_size, peak_file.source_mtime_ns) == \
+                    (stat_result.st_size, stat_result.st_mtime_ns):
+                return 'unchanged'
+            if is_same_format and stat_result.st_size > peak_file.source_size and \
+                    num_frames >= peak_file.num_frames:
+                # Only the last bin can be partial, it is computed again along with the new frames
+                start_frame = peak_file.num_frames // frames_per_bin * frames_per_bin
+                finest_level = peak_file.levels[0][:start_frame // frames_per_bin].copy()
+                status = 'appended'
+    finest_level = np.concatenate([finest_level, _compute_finest_level(wav_file, start_frame, num_frames,
+            frames_per_bin)])
+    levels = _compute_levels(finest_level, num_frames, frames_per_bin, zoom_factor)
+    header = struct.pack(PEAK_FILE_HEADER_FORMAT, PEAK_FILE_MAGIC, PEAK_FILE_VERSION, stat_result.st_size,
+            stat_result.st_mtime_ns, *peak_format, num_frames, len(levels))
+    # Written next to the sidecar and renamed over it so readers never see a half written file
+    temp_filename = peak_filename + '.tmp'
+    with open(temp_filename, 'wb') as peak_file_obj:
+        peak_file_obj.write(header)
+        peak_file_obj.write(struct.pack('<%dQ' % len(levels), *(len(level) for level in levels)))
+        for level in levels:
+            peak_file_obj.write(level.astype('<i2').tobytes())
+    os.replace(temp_filename, peak_filename)
+    return status
+
+
+def _get_num_frames_on_disk(wav_file, file_size):
+    """Returns the number of frames of wav_file, counting everything up to the
+    end of the file when the data chunk is the last chunk, since a file that is
+    still being written often has sizes in its header that are not updated yet.
+    """
+    if wav_file.chunks and wav_file.chunks[-1].chunk_id == 'data':
+        return (file_size - wav_file._get_data_offset()) // wav_file._get_bytes_per_frame()
+    return wav_file._get_num_frames()
+
+
+def _compute_finest_level(wav_file, start_frame, end_frame, frames_per_bin):
+    """Streams the frames from start_frame, which is the first frame of a bin,
+    to end_frame and returns their bins x channels x BIN_FIELDS int16 array.
+    """
+    num_channels = wav_file.meta_data.format_chunk_num_channels
+    bits_per_sample = wav_file.meta_data.format_chunk_bits_per_sample
+    scale = PEAK_FULL_SCALE / -pcm.get_sample_value_range(bits_per_sample)[0]
+    level_blocks = []
+    # Frames left over from the last block that do not make up a whole bin yet
+    leftover_frames = np.zeros((0, num_channels), dtype=np.int32)
+    blocks = wav_file._iter_data_blocks(start_frame, end_frame)
+    for _, data in itertools.chain(blocks, [(None, None)]):
+        if data is None:
+            if not len(leftover_frames):
+                break
+            # The frames after the last whole bin make up a partial bin
+            frames, num_bin_frames = leftover_frames, len(leftover_frames)
+        else:
+            frames = np.concatenate([leftover_frames, pcm.decode_frames(data, num_channels, bits_per_sample)])
+            num_bin_frames = frames_per_bin
+        num_whole_frames = len(frames) // num_bin_frames * num_bin_frames
+        bin_frames = frames[:num_whole_frames].reshape(-1, num_bin_frames, num_channels)
+        leftover_frames = frames[num_whole_frames:]
+        if len(bin_frames):
+            level_blocks.append(np.stack([bin_frames.min(axis=1), bin_frames.max(axis=1),
+                    np.sqrt(np.square(bin_frames, dtype=np.float64).mean(axis=1))], axis=-1) * scale)
+    if not level_blocks:
+        return np.zeros((0, num_channels, len(BIN_FIELDS)), dtype='<i2')
+    return np.clip(np.rint(np.concatenate(level_blocks)), -PEAK_FULL_SCALE, PEAK_FULL_SCALE - 1).astype('<i2')
+
+
+def _compute_levels(finest_level, num_frames, frames_per_bin, zoom_factor):
+    """Returns the list of every level, starting with finest_level and each
+    next one combining zoom_factor bins of the one before, until a level has a
+    single bin. RMS values are combined weighted by the frames in each bin since
+    the last bin of a level can be partial.
+    """
+    levels = [finest_level]
+    bin_sizes = np.full(len(finest_level), frames_per_bin, dtype=np.float64)
+    if len(bin_sizes):
+        bin_sizes[-1] = num_frames - (len(finest_level) - 1) * frames_per_bin
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        group_starts = np.arange(0, len(level), zoom_factor)
+        squares = np.square(level[:, :, 2], dtype=np.float64) * bin_sizes[:, np.newaxis]
+        bin_sizes = np.add.reduceat(bin_sizes, group_starts)
+        rms = np.sqrt(np.add.reduceat(squares, group_starts, axis=0) / bin_sizes[:, np.newaxis])
+        levels.append(np.stack([np.minimum.reduceat(level[:, :, 0], group_starts, axis=0),
+                np.maximum.reduceat(level[:, :, 1], group_starts, axis=0),
+                np.minimum(np.rint(rms), PEAK_FULL_SCALE - 1).astype('<i2')], axis=-1))
+    return levels
@@ -0,0 +1,144 @@
+"""Module that contains the streaming sample rate converter and channel mixer
+used by WavFile.create_new_wav_file_with_conversion.
+
+"""
+
+import math
+import functools
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+# Edge of the flat passband as a fraction of the lower of the two Nyquist frequencies, the
+#   transition band runs from there to that Nyquist frequency so nothing above it aliases back
+PASSBAND_FRACTION = 0.91
+STOPBAND_ATTENUATION_DB = 80.0
+# Kaiser window shape and the filter length it needs for a transition band, from Kaiser's formulas
+KAISER_BETA = 0.1102 * (STOPBAND_ATTENUATION_DB - 8.7)
+KAISER_LENGTH_FACTOR = (STOPBAND_ATTENUATION_DB - 7.95) / (2.285 * 2 * math.pi)
+# Output frames computed at a time, bounds the memory used to gather input windows
+OUTPUT_FRAMES_PER_CHUNK = 4096
+
+
+@functools.lru_cache(maxsize=None)
+def get_polyphase_filter_bank(up, down):
+    """Returns (filter_bank, delay) for a windowed sinc low pass filter for
+    resampling by up / down. filter_bank is an up x taps per phase array where
+    row p holds every up-th tap starting at tap p, and delay is the group delay
+    of the filter in samples at the upsampled rate. The filter has an odd number
+    of taps so delay is a whole number of samples, and it gets longer with
+    max(up, down) so decimation is filtered as well as interpolation. It is
+    built the first time a ratio is asked for and cached after.
+    """
+    # Frequencies in cycles per sample at the upsampled rate
+    stopband_edge = 0.5 / max(up, down)
+    passband_edge = PASSBAND_FRACTION * stopband_edge
+    num_taps = int(math.ceil(KAISER_LENGTH_FACTOR / (stopband_edge - passband_edge))) // 2 * 2 + 1
+    cutoff = (passband_edge + stopband_edge) / 2
+    tap_offsets = np.arange(num_taps) - (num_taps - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * tap_offsets) * np.kaiser(num_taps, KAISER_BETA)
+    # Upsampling spreads the energy of each input sample over up samples
+    taps *= up / taps.sum()
+    # Padded with zero taps so every phase has the same number of taps
+    taps_per_phase = -(-num_taps // up)
+    taps = np.append(taps, np.zeros(up * taps_per_phase - num_taps))
+    return taps.reshape(taps_per_phase, up).T.copy(), (num_taps - 1) // 2
+
+
+class PolyphaseResampler:
+    """Converts frames x channels blocks from src_rate to dest_rate, keeping the
+    last few input frames between calls so blocks can be fed one at a time.
+    Call flush() after the last block to get the frames still held back.
+
+    """
+
+    def __init__(self, src_rate, dest_rate, num_channels):
+        common_divisor = math.gcd(src_rate, dest_rate)
+        self.up = dest_rate // common_divisor
+        self.down = src_rate // common_divisor
+        # Delay of the filter in upsampled samples, output is shifted by it so it lines up with the input
+        filter_bank, self.delay = get_polyphase_filter_bank(self.up, self.down)
+        # Taps in reverse so they line up with a window of input frames in increasing order
+        self.reversed_filter_bank = filter_bank[:, ::-1]
+        self.taps_per_phase = filter_bank.shape[1]
+        # Input frames still needed by later output frames and the index of the first of them
+        self.buffer = np.zeros((self.taps_per_phase - 1, num_channels))
+        self.buffer_start_frame = -(self.taps_per_phase - 1)
+        self.num_input_frames = 0
+        self.num_output_frames = 0
+
+    def process(self, frames):
+        """Returns every output frame that can be computed from the input so far.
+        """
+        self.buffer = np.concatenate([self.buffer, frames])
+        self.num_input_frames += len(frames)
+        # Output frame m needs input frames up to (m * down + delay) // up
+        end_output_frame = (self.num_input_frames * self.up - self.delay - 1) // self.down + 1
+        return self._compute_output_frames(max(end_output_frame, self.num_output_frames))
+
+    def flush(self):
+        """Returns the remaining output frames, treating the input as silent after
+        its last frame.
+        """
+        end_output_frame = -(-self.num_input_frames * self.up // self.down)
+        num_padding_frames = self.delay // self.up + 2
+        self.buffer = np.concatenate([self.buffer, np.zeros((num_padding_frames, self.buffer.shape[1]))])
+        return self._compute_output_frames(end_output_frame)
+
+    def _compute_output_frames(self, end_output_frame):
+        if end_output_frame <= self.num_output_frames:
+            return np.zeros((0, self.buffer.shape[1]))
+        output_frame_indexes = np.arange(self.num_output_frames, end_output_frame)
+        upsampled_indexes = output_frame_indexes * self.down + self.delay
+        # Index in the buffer of the first of the taps_per_phase input frames each output frame is made of
+        window_indexes = upsampled_indexes // self.up - (self.taps_per_phase - 1) - self.buffer_start_frame
+        phases = upsampled_indexes % self.up
+        windows = sliding_window_view(self.buffer, self.taps_per_phase, axis=0)
+        output_frames = np.empty((len(output_frame_indexes), self.buffer.shape[1]))
+        for chunk_start in range(0, len(output_frames), OUTPUT_FRAMES_PER_CHUNK):
+            chunk = slice(chunk_start, chunk_start + OUTPUT_FRAMES_PER_CHUNK)
+            output_frames[chunk] = np.einsum('fct,ft->fc', windows[window_indexes[chunk]],
+                    self.reversed_filter_bank[phases[chunk]])
+        self.num_output_frames = end_output_frame
+        # Drop input frames that no later output frame reaches back to
+        next_input_frame = (self.num_output_frames * self.down + self.delay) // self.up
+        num_dropped_frames = min(max(next_input_frame - (self.taps_per_phase - 1) - self.buffer_start_frame, 0),
+                len(self.buffer))
+        self.buffer = self.buffer[num_dropped_frames:]
+        self.buffer_start_frame += num_dropped_frames
+        return output_frames
+
+
+def get_default_mix_matrix(src_num_channels, dest_num_channels):
+    """Returns the dest_num_channels x src_num_channels matrix used to mix
+    between channel counts when no other is given. Mono is copied to every
+    channel, everything else mixes down to mono by averaging, 5.1 in the
+    standard L R C LFE Ls Rs order is mixed to stereo with ITU-R BS.775
+    coefficients, and otherwise channels are kept by index and any new ones
+    are silent.
+    """
+    if src_num_channels == 1:
+        return np.ones((dest_num_channels, 1))
+    if dest_num_channels == 1:
+        return np.full((1, src_num_channels), 1 / src_num_channels)
+    if src_num_channels == 6 and dest_num_channels == 2:
+        center_gain = surround_gain = math.sqrt(0.5)
+        return np.array([
+            [1.0, 0.0, center_gain, 0.0, surround_gain, 0.0],
+            [0.0, 1.0, center_gain, 0.0, 0.0, surround_gain]
+        ])
+    return np.eye(dest_num_channels, src_num_channels)
+
+
+class ChannelMixer:
+    """Mixes frames x src channels blocks into frames x dest channels blocks
+    with a dest channels x src channels matrix.
+
+    """
+
+    def __init__(self, mix_matrix):
+        self.mix_matrix = np.asarray(mix_matrix, dtype=np.float64)
+
+    def process(self, frames):
+        return frames @ self.mix_matrix.T
@@ -0,0 +1,197 @@
+"""Module that contains block transformations that can be passed as the
+block_trans_func of WavFile.create_new_wav_file_with_transformation, and per
+sample versions of the channel removals that can be passed as its trans_func.
+
+"""
+
+import numpy as np
+
+
+def remove_left_channel(channel_index, sample_value):
+    if channel_index == 0:
+        return 0
+    else:
+        return sample_value
+
+
+def remove_right_channel(channel_index, sample_value):
+    if channel_index == 1:
+        return 0
+    else:
+        return sample_value
+
+
+def remove_left_channel_block(frame_index, frames):
+    frames[:, 0] = 0
+    return frames
+
+
+def remove_right_channel_block(frame_index, frames):
+    frames[:, 1] = 0
+    return frames
+
+
+block_transforms_by_name = {
+    'no-left-channel': remove_left_channel_block,
+    'no-right-channel': remove_right_channel_block
+}
+
+# name: index of the channel the block transformation silences
+removed_channel_indexes_by_name = {
+    'no-left-channel': 0,
+    'no-right-channel': 1
+}
+
+
+def check_block_transform(name, wav_file):
+    """Raises ValueError if the named block transformation can not be applied
+    to wav_file because it does not have the channel the transformation removes.
+    """
+    num_channels = wav_file.meta_data.format_chunk_num_channels
+    if removed_channel_indexes_by_name[name] >= num_channels:
+        raise ValueError("Can not apply %s to a file with %d channel%s" % (name, num_channels,
+                '' if num_channels == 1 else 's'))
+
+
+class TransformPipeline:
+    """Chains stages into one block transformation so that all of them are
+    applied in a single pass over the file. Each stage is called like a
+    block_trans_func but is given the frames as a float64 array, which is only
+    rounded back to integer samples once after the last stage.
+
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def __call__(self, frame_index, frames):
+        frames = frames.astype(np.float64)
+        for stage in self.stages:
+            frames = stage(frame_index, frames)
+        return np.rint(frames).astype(np.int64)
+
+
+class GainStage:
+
+    def __init__(self, gain_db):
+        self.gain = 10 ** (gain_db / 20)
+
+    def __call__(self, frame_index, frames):
+        return frames * self.gain
+
+
+class ChannelMuteStage:
+
+    def __init__(self, channel_index):
+        self.channel_index = channel_index
+
+    def __call__(self, frame_index, frames):
+        frames[:, self.channel_index] = 0
+        return frames
+
+
+class FadeInStage:
+    """Linear fade from silence over the first num_fade_frames frames.
+
+    """
+
+    def __init__(self, num_fade_frames):
+        self.num_fade_frames = num_fade_frames
+
+    def __call__(self, frame_index, frames):
+        if frame_index >= self.num_fade_frames:
+            return frames
+        frame_indexes = np.arange(frame_index, frame_index + len(frames))
+        gains = np.minimum(frame_indexes / self.num_fade_frames, 1.0)
+        return frames * gains[:, np.newaxis]
+
+
+class FadeOutStage:
+    """Linear fade to silence over the last num_fade_frames frames of a file
+    with num_frames frames.
+
+    """
+
+    def __init__(self, num_fade_frames, num_frames):
+        self.num_fade_frames = num_fade_frames
+        self.num_frames = num_frames
+
+    def __call__(self, frame_index, frames):
+        fade_start_frame = self.num_frames - self.num_fade_frames
+        if frame_index + len(frames) <= fade_start_frame:
+            return frames
+        frame_indexes = np.arange(frame_index, frame_index + len(frames))
+        gains = np.clip((self.num_frames - frame_indexes) / self.num_fade_frames, 0.0, 1.0)
+        return frames * gains[:, np.newaxis]
+
+
+class DitherStage:
+    """Adds triangular (TPDF) dither of one least significant bit of target_bits
+    and quantizes the samples to target_bits, while keeping them at the
+    bits_per_sample scale of the file. The noise is a hash of the index of each
+    sample so the output is the same however the file is split into blocks.
+
+    """
+
+    def __init__(self, bits_per_sample, target_bits, seed=0):
+        assert 1 <= target_bits <= bits_per_sample, "Can only dither to between 1 and %d bits" % bits_per_sample
+        self.step = 2 ** (bits_per_sample - target_bits)
+        self.seed = seed
+
+    def __call__(self, frame_index, frames):
+        num_samples = frames.size
+        sample_indexes = np.arange(frame_index * frames.shape[1], frame_index * frames.shape[1] + num_samples,
+                dtype=np.uint64).reshape(frames.shape)
+        noise = _hash_to_uniform(2 * sample_indexes, self.seed) - _hash_to_uniform(2 * sample_indexes + 1, self.seed)
+        return np.rint(frames / self.step + noise) * self.step
+
+
+def _hash_to_uniform(counters, seed):
+    """Maps an array of uint64 counters to floats uniform in [0, 1) with the
+    splitmix64 mixing function.
+    """
+    z = counters + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    return (z >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+
+def parse_pipeline(operations, wav_file):
+    """Returns a TransformPipeline for wav_file built from operation strings in
+    the form name or name:value, e.g. ['gain:-6', 'mute:1', 'fade-in:0.5',
+    'fade-out:2', 'dither:16']. Fade lengths are in seconds. The channel removal
+    operations in block_transforms_by_name are accepted as well. Raises
+    ValueError for an unknown operation or a value that does not fit wav_file.
+    """
+    sample_rate = wav_file.meta_data.format_chunk_sample_rate
+    num_channels = wav_file.meta_data.format_chunk_num_channels
+    bits_per_sample = wav_file.meta_data.format_chunk_bits_per_sample
+    num_frames = wav_file._get_num_frames()
+    stages = []
+    for operation in operations:
+        name, _, value = operation.partition(':')
+        if name in block_transforms_by_name:
+            check_block_transform(name, wav_file)
+            stages.append(block_transforms_by_name[name])
+        elif name == 'gain':
+            stages.append(GainStage(float(value)))
+        elif name == 'mute':
+            channel_index = int(value)
+            if not 0 <= channel_index < num_channels:
+                raise ValueError("Can not mute channel %d of a file with %d channels: %s" %
+                        (channel_index, num_channels, operation))
+            stages.append(ChannelMuteStage(channel_index))
+        elif name == 'fade-in':
+            stages.append(FadeInStage(max(int(float(value) * sample_rate), 1)))
+        elif name == 'fade-out':
+            stages.append(FadeOutStage(max(int(float(value) * sample_rate), 1), num_frames))
+        elif name == 'dither':
+            target_bits = int(value)
+            if not 1 <= target_bits <= bits_per_sample:
+                raise ValueError("Can only dither a %d bit file to between 1 and %d bits: %s" %
+                        (bits_per_sample, bits_per_sample, operation))
+            stages.append(DitherStage(bits_per_sample, target_bits))
+        else:
+            raise ValueError("Unknown operation: %s" % operation)
+    return TransformPipeline(stages)
@@ -5,6 +5,19 @@
 import struct
 import copy
 import math
+import mmap
+import os
+import sys
+import itertools
+import asyncio
+import collections
+import concurrent.futures
+
+import numpy as np
+
+from wav_file_util import pcm
+from wav_file_util import resampling
+from wav_file_util.metrics import ProcessingMetrics, time_stage
 
 
 class WavFileMetaData:
@@ -29,19 +42,40 @@ class WavFileMetaData:
     FORMAT_CHUNK_BYTE_RATE_OFFSET = 28
     FORMAT_CHUNK_BLOCK_ALIGN_OFFSET = 32
     FORMAT_CHUNK_BITS_PER_SAMPLE_OFFSET = 34
+    # Only present in fmt chunks bigger than 16 bytes, offsets are as if the fmt chunk started at 12 as well
+    FORMAT_CHUNK_EXTENSION_SIZE_OFFSET = 36
+    FORMAT_CHUNK_VALID_BITS_PER_SAMPLE_OFFSET = 38
+    FORMAT_CHUNK_CHANNEL_MASK_OFFSET = 40
+    FORMAT_CHUNK_SUB_FORMAT_OFFSET = 44
 
     DATA_CHUNK_ID_OFFSET = 36
     DATA_CHUNK_SIZE_OFFSET = 40
     DATA_CHUNK_DATA_OFFSET = 44 # Actual sound data starts here
 
+    # RF64 ds64 chunk byte offsets from the start of its payload
+    DS64_CHUNK_RIFF_SIZE_OFFSET = 0
+    DS64_CHUNK_DATA_SIZE_OFFSET = 8
+    DS64_CHUNK_SAMPLE_COUNT_OFFSET = 16
+    DS64_CHUNK_TABLE_LENGTH_OFFSET = 24
+    DS64_CHUNK_TABLE_OFFSET = 28
+    DS64_CHUNK_SIZE = 28 # Without any table entries
+
     # WAV meta data expected values to ensure correct format in WAV files
     SUPER_CHUNK_ID_EXPECTED = 0x52494646 # "RIFF" in ascii (Big-endian)
+    SUPER_CHUNK_ID_RF64 = 0x52463634 # "RF64" in ascii (Big-endian), RIFF with 64 bit sizes
+    SUPER_CHUNK_ID_BW64 = 0x42573634 # "BW64" in ascii (Big-endian), the EBU name for RF64
+    # 32 bit sizes that are set to this have their real 64 bit value in the ds64 chunk
+    RF64_PLACEHOLDER_SIZE = 0xFFFFFFFF
     SUPER_CHUNK_FORMAT_EXPECTED = 0x57415645 # "WAVE" in ascii (Big-endian)
 
     FORMAT_CHUNK_ID_EXPECTED = 0x666D7420 # "fmt " in ascii (Big-endian)
     FORMAT_CHUNK_SIZE_EXPECTED = 16
 
     FORMAT_CHUNK_AUDIO_FORMAT_EXPECTED = 1 # PCM (Linear)
+    FORMAT_CHUNK_AUDIO_FORMAT_EXTENSIBLE = 0xFFFE # WAVE_FORMAT_EXTENSIBLE, actual format is in the sub format
+    FORMAT_CHUNK_EXTENSIBLE_SIZE = 40
+    FORMAT_CHUNK_EXTENSION_SIZE_EXTENSIBLE = 22
+    FORMAT_CHUNK_SUB_FORMAT_PCM = bytes.fromhex('0100000000001000800000aa00389b71') # KSDATAFORMAT_SUBTYPE_PCM
     FORMAT_CHUNK_NUM_CHANNELS_EXPECTED = 2 # Stereo
 
     DATA_CHUNK_ID_EXPECTED = 0x64617461 # "data" in ascii (Big-endian)
@@ -52,26 +86,34 @@ class WavFileMetaData:
     BYTES_PER_SAMPLE_DEFAULT = 3 # Because that was the number I saw in one wav file
 
     @classmethod
-    def make_default(cls):
-        bytes_of_audio_data = cls.NUM_SAMPLES_DEFAULT * cls.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED * cls.BYTES_PER_SAMPLE_DEFAULT
+    def make_default(cls, sample_rate=FORMAT_CHUNK_SAMPLE_RATE_DEFAULT, bits_per_sample=BYTES_PER_SAMPLE_DEFAULT * 8,
+            num_channels=FORMAT_CHUNK_NUM_CHANNELS_EXPECTED, duration_seconds=AUDIO_DURATION_IN_SECONDS_DEFAULT):
+        """Returns meta data for a PCM wav file with the given format that holds
+        duration_seconds of audio. If duration_seconds is None the length is not
+        known yet, so the data chunk size is 0 and room is left in the header to
+        turn it into RF64 once the real size is set with set_data_chunk_size.
+        """
         meta_data = WavFileMetaData()
         meta_data.super_chunk_id = cls.SUPER_CHUNK_ID_EXPECTED
-        # There are 8 (super_chunk_id and super_chunk_size itself) not included in super_chunk_size
-        meta_data.super_chunk_size = cls.NUM_BYTES_BEFORE_DATA_STARTS - 8 + bytes_of_audio_data
         meta_data.super_chunk_format = cls.SUPER_CHUNK_FORMAT_EXPECTED
         meta_data.format_chunk_id = cls.FORMAT_CHUNK_ID_EXPECTED
         meta_data.format_chunk_size = cls.FORMAT_CHUNK_SIZE_EXPECTED
         meta_data.format_chunk_audio_format = cls.FORMAT_CHUNK_AUDIO_FORMAT_EXPECTED
-        meta_data.format_chunk_num_channels = cls.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED
-        meta_data.format_chunk_sample_rate = cls.FORMAT_CHUNK_SAMPLE_RATE_DEFAULT
-
-        meta_data.format_chunk_byte_rate = cls.FORMAT_CHUNK_SAMPLE_RATE_DEFAULT * \
-                cls.BYTES_PER_SAMPLE_DEFAULT * cls.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED
-        meta_data.format_chunk_block_align = cls.BYTES_PER_SAMPLE_DEFAULT \
-                * cls.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED
-        meta_data.format_chunk_bits_per_sample = cls.BYTES_PER_SAMPLE_DEFAULT * 8
+        meta_data.format_chunk_num_channels = num_channels
+        meta_data.format_chunk_sample_rate = sample_rate
+
+        meta_data.format_chunk_byte_rate = sample_rate * bits_per_sample // 8 * num_channels
+        meta_data.format_chunk_block_align = bits_per_sample // 8 * num_channels
+        meta_data.format_chunk_bits_per_sample = bits_per_sample
+        if num_channels > 2:
+            meta_data.set_extensible_format()
         meta_data.data_chunk_id = cls.DATA_CHUNK_ID_EXPECTED
-        meta_data.data_chunk_size = bytes_of_audio_data 
+        if duration_seconds is None:
+            meta_data.reserve_ds64 = True
+            meta_data.set_data_chunk_size(0)
+        else:
+            num_frames = round(duration_seconds * sample_rate)
+            meta_data.set_data_chunk_size(num_frames * meta_data.format_chunk_block_align)
         return meta_data
 
     def __init__(self):
@@ -86,13 +128,77 @@ class WavFileMetaData:
         self.format_chunk_byte_rate = 0x0
         self.format_chunk_block_align = 0x0
         self.format_chunk_bits_per_sample = 0x0
+        # Only used when format_chunk_size is bigger than 16
+        self.format_chunk_extension_size = 0x0
+        self.format_chunk_valid_bits_per_sample = 0x0
+        self.format_chunk_channel_mask = 0x0
+        self.format_chunk_sub_format = b''
         self.data_chunk_id = 0x0
         self.data_chunk_size = 0x0
+        # Whether to write a JUNK chunk the size of a ds64 chunk so the header can become RF64 in place
+        self.reserve_ds64 = False
+
+    def is_extensible(self):
+        return self.format_chunk_audio_format == WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_EXTENSIBLE
+
+    def is_rf64(self):
+        """Returns True if the meta data has to be written as RF64, either because
+        it was read from an RF64 file or because the sizes do not fit in 32 bits.
+        """
+        if self.super_chunk_id in (WavFileMetaData.SUPER_CHUNK_ID_RF64, WavFileMetaData.SUPER_CHUNK_ID_BW64):
+            return True
+        riff_size = 4 + 8 + self.format_chunk_size + 8 + self.data_chunk_size
+        if self.reserve_ds64:
+            riff_size += 8 + WavFileMetaData.DS64_CHUNK_SIZE
+        return riff_size >= WavFileMetaData.RF64_PLACEHOLDER_SIZE
+
+    def set_extensible_format(self):
+        """Switches the fmt chunk to WAVE_FORMAT_EXTENSIBLE with PCM samples, which
+        is needed for more than 2 channels.
+        """
+        self.format_chunk_size = WavFileMetaData.FORMAT_CHUNK_EXTENSIBLE_SIZE
+        self.format_chunk_audio_format = WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_EXTENSIBLE
+        self.format_chunk_extension_size = WavFileMetaData.FORMAT_CHUNK_EXTENSION_SIZE_EXTENSIBLE
+        self.format_chunk_valid_bits_per_sample = self.format_chunk_bits_per_sample
+        # Speakers are assigned in the standard order, there are 18 speaker positions
+        self.format_chunk_channel_mask = (1 << self.format_chunk_num_channels) - 1 \
+                if self.format_chunk_num_channels <= 18 else 0
+        self.format_chunk_sub_format = WavFileMetaData.FORMAT_CHUNK_SUB_FORMAT_PCM
+
+    def set_data_chunk_size(self, data_chunk_size):
+        """Sets data_chunk_size and the super_chunk_size that depends on it.
+        """
+        self.data_chunk_size = data_chunk_size
+        # There are 8 (super_chunk_id and super_chunk_size itself) not included in super_chunk_size
+        self.super_chunk_size = len(self.get_bytes()) - 8 + data_chunk_size + data_chunk_size % 2
 
-    def get_bytes(self):
-        bytesobj = struct.pack('>I', self.super_chunk_id)
-        bytesobj += struct.pack('<I', self.super_chunk_size)
-        bytesobj += struct.pack('>I', self.super_chunk_format)
+    def get_bytes(self, streaming=False):
+        """Returns the bytes of the header that comes before the sound data, which
+        is RF64 with a ds64 chunk if is_rf64() is True. If streaming is True the
+        sizes are written as 0xFFFFFFFF, which readers take to mean the data runs
+        to the end of the stream, for output whose length is not known up front.
+        """
+        is_rf64 = self.is_rf64() and not streaming
+        if streaming:
+            bytesobj = struct.pack('>I', WavFileMetaData.SUPER_CHUNK_ID_EXPECTED)
+            bytesobj += struct.pack('<I', WavFileMetaData.RF64_PLACEHOLDER_SIZE)
+            bytesobj += struct.pack('>I', self.super_chunk_format)
+        elif is_rf64:
+            bytesobj = struct.pack('>I', WavFileMetaData.SUPER_CHUNK_ID_RF64)
+            bytesobj += struct.pack('<I', WavFileMetaData.RF64_PLACEHOLDER_SIZE)
+            bytesobj += struct.pack('>I', self.super_chunk_format)
+            bytesobj += b'ds64' + struct.pack('<I', WavFileMetaData.DS64_CHUNK_SIZE)
+            bytesobj += struct.pack('<Q', self.super_chunk_size)
+            bytesobj += struct.pack('<Q', self.data_chunk_size)
+            bytesobj += struct.pack('<Q', self.data_chunk_size // max(self.format_chunk_block_align, 1))
+            bytesobj += struct.pack('<I', 0)
+        else:
+            bytesobj = struct.pack('>I', self.super_chunk_id)
+            bytesobj += struct.pack('<I', self.super_chunk_size)
+            bytesobj += struct.pack('>I', self.super_chunk_format)
+            if self.reserve_ds64:
+                bytesobj += b'JUNK' + struct.pack('<I', WavFileMetaData.DS64_CHUNK_SIZE)
+                bytesobj += bytes(WavFileMetaData.DS64_CHUNK_SIZE)
         bytesobj += struct.pack('>I', self.format_chunk_id)
         bytesobj += struct.pack('<I', self.format_chunk_size)
         bytesobj += struct.pack('<H', self.format_chunk_audio_format)
@@ -101,10 +207,36 @@ class WavFileMetaData:
         bytesobj += struct.pack('<I', self.format_chunk_byte_rate)
         bytesobj += struct.pack('<H', self.format_chunk_block_align)
         bytesobj += struct.pack('<H', self.format_chunk_bits_per_sample)
+        if self.format_chunk_size > WavFileMetaData.FORMAT_CHUNK_SIZE_EXPECTED:
+            bytesobj += struct.pack('<H', self.format_chunk_extension_size)
+        if self.is_extensible():
+            bytesobj += struct.pack('<H', self.format_chunk_valid_bits_per_sample)
+            bytesobj += struct.pack('<I', self.format_chunk_channel_mask)
+            bytesobj += self.format_chunk_sub_format
         bytesobj += struct.pack('>I', self.data_chunk_id)
-        bytesobj += struct.pack('<I', self.data_chunk_size)
+        bytesobj += struct.pack('<I', WavFileMetaData.RF64_PLACEHOLDER_SIZE if is_rf64 or streaming else self.data_chunk_size)
         return bytesobj
 
+class WavChunk:
+    """The id, offset from the start of the file and size of one RIFF chunk as
+    found when walking the chunks of a wav file.
+
+    """
+
+    HEADER_SIZE = 8
+
+    def __init__(self, chunk_id, offset, size):
+        self.chunk_id = chunk_id
+        self.offset = offset
+        self.size = size
+
+    def get_data_offset(self):
+        return self.offset + WavChunk.HEADER_SIZE
+
+    def get_end_offset(self):
+        # Chunks are padded to an even number of bytes
+        return self.get_data_offset() + self.size + self.size % 2
+
 class WavFile:
     """The class that represents a wav file read from dics. Also the class that
     contains methods to validate data.
@@ -112,71 +244,293 @@ class WavFile:
     """
 
     # How many audio samples are loaded into memory at a time when streaming wav file data
-    SAMPLES_PER_BLOCK = 1000
+    SAMPLES_PER_BLOCK = 65536
 
     @classmethod
-    def create_new_wav_file_with_transformation(cls, src_wav_file, dest_wav_filename, trans_func=None):
+    def create_new_wav_file_with_transformation(cls, src_wav_file, dest_wav_filename, trans_func=None,
+            block_trans_func=None, workers=1, metrics=None):
         """Apply trans_func to each sample and all the channels for that sample if
         trans_func is None then the new wav file will be an exact copy.
-        trans_func should accept channel_index: int and sample_value: int as paramaters
+        trans_func should accept channel_index: int and sample_value: int as paramaters,
+        where channel_index is the 0 based index of the channel the sample is in, e.g. 0
+        for left and 1 for right, and sample_value is the signed value of the sample,
+        also for 8 bit files whose bytes are stored unsigned. It should return the new
+        signed sample value, which is clipped to the range of the bit depth.
         uses src_wav_file as file data input and dest_wav_filename as the filename to output to.
+        block_trans_func can be given instead of trans_func to transform a whole block
+        of samples at a time. It should accept frame_index: int, the index of the first
+        frame in the block, and frames: a frames x channels numpy int32 array of signed
+        sample values, and return an array of the same shape.
+        If workers is more than 1 the data chunk is split into that many frame aligned
+        segments that are transformed in parallel by a process pool, so the transformation
+        must be picklable and must not depend on the blocks being processed in order.
+        If metrics, a ProcessingMetrics, is given the time spent in every stage and
+        the amount of data processed are added to it.
         A WavFile object will be returned whose filename is the dest_wav_filename and whose contents
         have been written to disk.
         """
+        assert trans_func is None or block_trans_func is None, "Only one of trans_func and block_trans_func can be given"
+        if trans_func is not None:
+            block_trans_func = PerSampleTransformation(trans_func)
+        if metrics is not None:
+            metrics.start()
         dest_wav_file = WavFile(dest_wav_filename)
         # Copy meta data obj over and write contents to disk
         cls._copy_meta_data(src_wav_file, dest_wav_file)
         dest_wav_file.write_meta_data_to_disk()
-        write_file = open(dest_wav_file.filename, 'ab')
-        # Read from source wav file on disk and write to dest wav file
-        #   in blocks so as not to lead the whole file into memory
-        with open(src_wav_file.filename, 'rb') as wav_file_obj:
-            wav_file_obj.seek(WavFileMetaData.NUM_BYTES_BEFORE_DATA_STARTS)
-            bytes_per_block = src_wav_file._get_read_block_size()
-            struct_format_str, padding = src_wav_file._get_per_sample_struct_format_str_and_padding()
-            while True:
-                data = bytearray(wav_file_obj.read(bytes_per_block))
-                channel_index = 0
-                bytes_per_sample = src_wav_file.meta_data.format_chunk_bits_per_sample // 8
-                for sample_offset in range(0, len(data), bytes_per_sample):
-                    sample_value = int(struct.unpack_from(struct_format_str, data[sample_offset:sample_offset+bytes_per_sample]+padding)[0])
-                    channel_index = (channel_index + 1) % src_wav_file.meta_data.format_chunk_num_channels
-                    if trans_func is not None:
-                        sample_value = trans_func(channel_index, sample_value)
-                    data[sample_offset:sample_offset+bytes_per_sample] = struct.pack(struct_format_str, sample_value)[:-len(padding)]
-                write_file.write(bytes(data)) 
-                if len(data) < bytes_per_block:
-                    break
-        write_file.close()
+        if workers > 1:
+            cls._transform_data_in_parallel(src_wav_file, dest_wav_file, block_trans_func, workers, metrics)
+        else:
+            # Read from source wav file on disk and write to dest wav file
+            #   in blocks so as not to lead the whole file into memory
+            with open(dest_wav_file.filename, 'ab') as write_file:
+                for frame_index, data in src_wav_file._iter_data_blocks(metrics=metrics):
+                    data = src_wav_file._transform_block(frame_index, data, block_trans_func, metrics)
+                    with time_stage(metrics, 'write'):
+                        write_file.write(data)
+                    if metrics is not None:
+                        metrics.num_bytes_written += len(data)
+                        metrics.end_block()
+        cls._copy_chunks_after_data(src_wav_file, dest_wav_file)
+        # The copied header can hold placeholder or stale sizes, e.g. from a stream or a file cut short
+        dest_wav_file._write_sizes_to_disk()
+        if metrics is not None:
+            metrics.stop()
         return dest_wav_file
 
     @classmethod
-    def create_new_wav_file_with_wave_form(cls, filename, wave_form):
+    def create_new_wav_file_with_wave_form(cls, filename, wave_form,
+            sample_rate=WavFileMetaData.FORMAT_CHUNK_SAMPLE_RATE_DEFAULT,
+            bits_per_sample=WavFileMetaData.BYTES_PER_SAMPLE_DEFAULT * 8,
+            num_channels=WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED,
+            duration_seconds=WavFileMetaData.AUDIO_DURATION_IN_SECONDS_DEFAULT, metrics=None):
+        """Generates duration_seconds of wave_form in a wav file of the given format,
+        with the same level in every channel. filename can be '-' to write to stdout
+        and can be a pipe. If duration_seconds is None generation goes on until the
+        reader closes the pipe or it is interrupted. The header of such output has
+        its sizes filled in at the end if the output is seekable and otherwise has
+        streaming sizes. Memory use is the same whatever the duration. metrics is
+        filled in as by create_new_wav_file_with_transformation.
+        """
+        if metrics is not None:
+            metrics.start()
         wav_file = WavFile(filename)
-        wav_file.meta_data = WavFileMetaData.make_default()
-        wav_file.meta_data_bytes = wav_file.meta_data.get_bytes()
-        wav_file.write_meta_data_to_disk()
-        sample_max_value = 2 ** wav_file.meta_data.format_chunk_bits_per_sample - 1
-        # Num samples in one tick of wave
-        wave_sample_period = wav_file.meta_data.format_chunk_sample_rate // wave_form.frequency
-        sample_offset_from_x_origin = 0
-        with open(wav_file.filename, 'ab') as write_file:
-            for block_index in range(0, math.ceil(WavFileMetaData.NUM_SAMPLES_DEFAULT / 1000)):
-                bytes_per_block = cls.SAMPLES_PER_BLOCK * WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED * WavFileMetaData.BYTES_PER_SAMPLE_DEFAULT
-                data = b''
-                sample_index_start = block_index * cls.SAMPLES_PER_BLOCK
-                for _ in range(sample_index_start, min(sample_index_start + cls.SAMPLES_PER_BLOCK, WavFileMetaData.NUM_SAMPLES_DEFAULT)):
-                    x_val_for_eqn = sample_offset_from_x_origin / wave_sample_period * 2 * math.pi
-                    y_val_from_eqn = wave_form.y_from_x(x_val_for_eqn)
-                    sample_value = int(y_val_from_eqn * sample_max_value / 2)
-                    fmt_str, padding = wav_file._get_per_sample_struct_format_str_and_padding()
-                    # Write same level to all channels
-                    for _ in range(wav_file.meta_data.format_chunk_num_channels):
-                        data += struct.pack(fmt_str, sample_value)[:-len(padding)]
-                    sample_offset_from_x_origin += 1
-                write_file.write(data)
+        wav_file.meta_data = WavFileMetaData.make_default(sample_rate, bits_per_sample, num_channels, duration_seconds)
+        num_frames = wav_file._get_num_frames() if duration_seconds is not None else None
+        sample_max_value = 2 ** bits_per_sample - 1
+        # Every block is encoded into the same buffer
+        block_buffer = bytearray(wav_file._get_read_block_size())
+        write_file = sys.stdout.buffer if filename == '-' else open(filename, 'wb')
+        try:
+            is_seekable = write_file.seekable()
+            wav_file.meta_data_bytes = wav_file.meta_data.get_bytes(streaming=num_frames is None and not is_seekable)
+            write_file.write(wav_file.meta_data_bytes)
+            sample_index_start = 0
+            try:
+                while num_frames is None or sample_index_start < num_frames:
+                    num_block_frames = cls.SAMPLES_PER_BLOCK if num_frames is None else \
+                            min(cls.SAMPLES_PER_BLOCK, num_frames - sample_index_start)
+                    with time_stage(metrics, 'generate'):
+                        y_vals_from_eqn = wave_form.render(sample_index_start, num_block_frames, sample_rate)
+                        sample_values = (y_vals_from_eqn * sample_max_value / 2).astype(np.int64)
+                        # Write same level to all channels
+                        frames = np.broadcast_to(sample_values[:, np.newaxis], (num_block_frames, num_channels))
+                    with time_stage(metrics, 'encode'):
+                        data = memoryview(block_buffer)[:num_block_frames * num_channels * bits_per_sample // 8]
+                        pcm.encode_frames(frames, bits_per_sample, out=data)
+                    with time_stage(metrics, 'write'):
+                        write_file.write(data)
+                    if metrics is not None:
+                        metrics.num_samples += frames.size
+                        metrics.num_bytes_written += len(data)
+                        metrics.end_block()
+                    sample_index_start += num_block_frames
+            except (BrokenPipeError, KeyboardInterrupt):
+                # Only generation without an end is expected to be stopped this way
+                if num_frames is not None:
+                    raise
+            if num_frames is None and is_seekable:
+                # Patch the header with the real sizes now that they are known
+                wav_file.meta_data.set_data_chunk_size(sample_index_start * wav_file._get_bytes_per_frame())
+                wav_file.meta_data_bytes = wav_file.meta_data.get_bytes()
+                write_file.seek(0)
+                write_file.write(wav_file.meta_data_bytes)
+        finally:
+            if write_file is not sys.stdout.buffer:
+                write_file.close()
+        if metrics is not None:
+            metrics.stop()
         return wav_file
 
+    @classmethod
+    def create_new_wav_file_with_conversion(cls, src_wav_file, dest_wav_filename, sample_rate=None,
+            num_channels=None, mix_matrix=None, block_trans_func=None, metrics=None):
+        """Converts src_wav_file to sample_rate and num_channels, either of which
+        can be None to keep that of the source, and writes it to dest_wav_filename.
+        Channels are mixed with mix_matrix, a dest channels x src channels list of
+        gains, or with resampling.get_default_mix_matrix if it is None. If given,
+        block_trans_func is applied to the source frames first, as it would be by
+        create_new_wav_file_with_transformation. The data chunk is streamed block
+        by block and the header is written with the real sizes at the end. Chunks
+        other than fmt and data are not copied since they may describe the source
+        format. metrics is filled in as by create_new_wav_file_with_transformation,
+        with the time spent resampling and mixing counted as transform.
+        """
+        if metrics is not None:
+            metrics.start()
+        src_meta_data = src_wav_file.meta_data
+        src_num_channels = src_meta_data.format_chunk_num_channels
+        bits_per_sample = src_meta_data.format_chunk_bits_per_sample
+        sample_rate = sample_rate or src_meta_data.format_chunk_sample_rate
+        num_channels = num_channels or src_num_channels
+        mixer = None
+        if mix_matrix is not None or num_channels != src_num_channels:
+            if mix_matrix is None:
+                mix_matrix = resampling.get_default_mix_matrix(src_num_channels, num_channels)
+            mixer = resampling.ChannelMixer(mix_matrix)
+            assert mixer.mix_matrix.shape == (num_channels, src_num_channels), \
+                    "Mix matrix must be %d x %d" % (num_channels, src_num_channels)
+        resampler = None
+        if sample_rate != src_meta_data.format_chunk_sample_rate:
+            # Resample whichever side has fewer channels
+            resampler = resampling.PolyphaseResampler(src_meta_data.format_chunk_sample_rate, sample_rate,
+                    min(num_channels, src_num_channels))
+        stages = [stage for stage in ([mixer, resampler] if num_channels <= src_num_channels else [resampler, mixer])
+                if stage is not None]
+        dest_wav_file = WavFile(dest_wav_filename)
+        dest_wav_file.meta_data = WavFileMetaData.make_default(sample_rate, bits_per_sample, num_channels, None)
+        dest_wav_file.meta_data_bytes = dest_wav_file.meta_data.get_bytes()
+        num_data_bytes = 0
+        with open(dest_wav_filename, 'wb') as write_file:
+            write_file.write(dest_wav_file.meta_data_bytes)
+            # None marks the end of the source, after which the resampler gives back what it holds
+            for frame_index, data in itertools.chain(src_wav_file._iter_data_blocks(metrics=metrics), [(None, None)]):
+                if data is None:
+                    if resampler is None:
+                        break
+                    with time_stage(metrics, 'transform'):
+                        frames = resampler.flush()
+                    stages = stages[stages.index(resampler) + 1:]
+                else:
+                    with time_stage(metrics, 'decode'):
+                        frames = pcm.decode_frames(data, src_num_channels, bits_per_sample)
+                    if metrics is not None:
+                        metrics.num_samples += frames.size
+                with time_stage(metrics, 'transform'):
+                    if block_trans_func is not None and data is not None:
+                        frames = block_trans_func(frame_index, frames)
+                    for stage in stages:
+                        frames = stage.process(frames)
+                with time_stage(metrics, 'encode'):
+                    data = pcm.encode_frames(np.rint(frames), bits_per_sample)
+                with time_stage(metrics, 'write'):
+                    write_file.write(data)
+                if metrics is not None:
+                    metrics.num_bytes_written += len(data)
+                    metrics.end_block()
+                num_data_bytes += len(data)
+            if num_data_bytes % 2:
+                write_file.write(b'\x00')
+            dest_wav_file.meta_data.set_data_chunk_size(num_data_bytes)
+            dest_wav_file.meta_data_bytes = dest_wav_file.meta_data.get_bytes()
+            write_file.seek(0)
+            write_file.write(dest_wav_file.meta_data_bytes)
+        if metrics is not None:
+            metrics.stop()
+        return dest_wav_file
+
+    def analyze(self, silence_threshold_db=-60.0):
+        """Streams the data chunk once and returns a dict of statistics about the
+        whole file and a list with the peak, RMS, DC offset, number of clipped
+        samples and silence of each channel. Levels in dB are relative to full
+        scale and a frame is silent in a channel if its level there is at or below
+        silence_threshold_db.
+        """
+        num_channels = self.meta_data.format_chunk_num_channels
+        bits_per_sample = self.meta_data.format_chunk_bits_per_sample
+        min_value, max_value = pcm.get_sample_value_range(bits_per_sample)
+        full_scale = float(-min_value)
+        silence_threshold = full_scale * 10 ** (silence_threshold_db / 20)
+        num_frames = 0
+        sums = np.zeros(num_channels)
+        sums_of_squares = np.zeros(num_channels)
+        peaks = np.zeros(num_channels, dtype=np.int64)
+        clipped_samples = np.zeros(num_channels, dtype=np.int64)
+        silent_frames = np.zeros(num_channels, dtype=np.int64)
+        for _, data in self._iter_data_blocks():
+            frames = pcm.decode_frames(data, num_channels, bits_per_sample).astype(np.int64)
+            num_frames += len(frames)
+            sums += frames.sum(axis=0)
+            sums_of_squares += np.square(frames, dtype=np.float64).sum(axis=0)
+            abs_frames = np.abs(frames)
+            peaks = np.maximum(peaks, abs_frames.max(axis=0, initial=0))
+            clipped_samples += ((frames <= min_value) | (frames >= max_value)).sum(axis=0)
+            silent_frames += (abs_frames <= silence_threshold).sum(axis=0)
+        channels = []
+        for channel_index in range(num_channels):
+            rms = math.sqrt(sums_of_squares[channel_index] / num_frames) if num_frames else 0.0
+            channels.append({
+                'peak': int(peaks[channel_index]),
+                'peak_dbfs': _to_dbfs(peaks[channel_index], full_scale),
+                'rms': rms,
+                'rms_dbfs': _to_dbfs(rms, full_scale),
+                'dc_offset': sums[channel_index] / num_frames / full_scale if num_frames else 0.0,
+                'clipped_samples': int(clipped_samples[channel_index]),
+                'silent_frames': int(silent_frames[channel_index]),
+                'is_silent': bool(silent_frames[channel_index] == num_frames)
+            })
+        return {
+            'filename': self.filename,
+            'sample_rate': self.meta_data.format_chunk_sample_rate,
+            'bits_per_sample': bits_per_sample,
+            'num_channels': num_channels,
+            'num_frames': num_frames,
+            'duration_seconds': num_frames / self.meta_data.format_chunk_sample_rate,
+            'channels': channels
+        }
+
+    async def aiter_blocks(self, start_frame=0, end_frame=None, read_ahead=2, executor=None):
+        """Async generator counterpart of _iter_data_blocks that yields tuples of
+        frame_index: int, the index of the first frame in the block, and the
+        decoded frames x channels int32 array of the block. Reading and decoding
+        run on executor, or the default executor of the loop if it is None, with
+        up to read_ahead blocks in flight, so the next blocks are being read while
+        the current one is used and the event loop is never blocked on disk.
+        """
+        loop = asyncio.get_running_loop()
+        num_channels = self.meta_data.format_chunk_num_channels
+        bits_per_sample = self.meta_data.format_chunk_bits_per_sample
+        bytes_per_block = self._get_read_block_size()
+        bytes_per_frame = self._get_bytes_per_frame()
+        data_offset = self._get_data_offset()
+        end_offset = data_offset + (self._get_num_frames() if end_frame is None else end_frame) * bytes_per_frame
+        block_offsets = iter(range(data_offset + start_frame * bytes_per_frame, end_offset, bytes_per_block))
+        fd = await loop.run_in_executor(executor, os.open, self.filename, os.O_RDONLY)
+        pending = collections.deque()
+
+        def read_next_block():
+            offset = next(block_offsets, None)
+            if offset is not None:
+                pending.append((offset, loop.run_in_executor(executor, _read_frames_block, fd, offset,
+                        min(bytes_per_block, end_offset - offset), num_channels, bits_per_sample)))
+
+        try:
+            for _ in range(max(read_ahead, 1)):
+                read_next_block()
+            while pending:
+                offset, future = pending[0]
+                read_next_block()
+                # Shielded so a cancelled caller leaves the read in pending to be waited for below
+                frames = await asyncio.shield(future)
+                pending.popleft()
+                if len(frames) == 0:
+                    break
+                yield (offset - data_offset) // bytes_per_frame, frames
+        finally:
+            # The file can only be closed once no worker is reading from it
+            await _wait_for_executor_futures(future for _, future in pending)
+            os.close(fd)
+
     # Static methods to get WavFile instances
 
     @classmethod
@@ -185,6 +539,12 @@ class WavFile:
         wav_file._read_meta_data_from_disk()
         return wav_file
 
+    @classmethod
+    async def aopen_existing(cls, filename, executor=None):
+        """Async counterpart of open_existing that reads the meta data on executor.
+        """
+        return await asyncio.get_running_loop().run_in_executor(executor, cls.open_existing, filename)
+
     @classmethod
     def open_new_default_meta_data(cls, filename):
         wav_file = WavFile(filename)
@@ -195,6 +555,37 @@ class WavFile:
         self.filename = filename
         self.meta_data = None
         self.meta_data_bytes = None
+        # List of WavChunk for every chunk in the file, filled in when read from disk
+        self.chunks = None
+        self._frames = None
+
+    def __getstate__(self):
+        # The memory map can not be pickled when a WavFile is sent to a worker process
+        state = self.__dict__.copy()
+        state['_frames'] = None
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def frames(self):
+        """A WavFrames view of the data chunk that is memory mapped the first
+        time it is accessed.
+        """
+        if self._frames is None:
+            self._frames = WavFrames(self)
+        return self._frames
+
+    def close(self):
+        """Releases the memory map behind frames if it was ever created.
+        """
+        if self._frames is not None:
+            self._frames.close()
+            self._frames = None
 
     def write_meta_data_to_disk(self):
         with open(self.filename, 'wb') as wav_file_obj:
@@ -204,17 +595,234 @@ class WavFile:
 
     @classmethod
     def _copy_meta_data(cls, src_wav_file, dest_wav_file):
+        """Copies the meta data of src_wav_file, including the bytes of every chunk
+        before the data chunk, to dest_wav_file along with its chunk index.
+        """
         dest_wav_file.meta_data = copy.deepcopy(src_wav_file.meta_data)
         dest_wav_file.meta_data_bytes = src_wav_file.meta_data_bytes
+        dest_wav_file.chunks = copy.deepcopy(src_wav_file.chunks)
+
+    @classmethod
+    def _copy_chunks_after_data(cls, src_wav_file, dest_wav_file):
+        """Copies every chunk that comes after the data chunk in src_wav_file to the
+        same place after the data chunk of dest_wav_file. The bytes are copied
+        within the kernel where possible so their payloads are never read into python.
+        """
+        if not src_wav_file.chunks:
+            return
+        start_offset = src_wav_file._get_data_offset() + src_wav_file.meta_data.data_chunk_size
+        end_offset = max(chunk.get_end_offset() for chunk in src_wav_file.chunks)
+        if end_offset <= start_offset:
+            return
+        dest_offset = dest_wav_file._get_data_offset() + dest_wav_file.meta_data.data_chunk_size
+        with open(src_wav_file.filename, 'rb') as src_file_obj, open(dest_wav_file.filename, 'r+b') as dest_file_obj:
+            if hasattr(os, 'copy_file_range'):
+                while start_offset < end_offset:
+                    num_bytes_copied = os.copy_file_range(src_file_obj.fileno(), dest_file_obj.fileno(),
+                            end_offset - start_offset, start_offset, dest_offset)
+                    if num_bytes_copied == 0:
+                        break
+                    start_offset += num_bytes_copied
+                    dest_offset += num_bytes_copied
+            else:
+                src_file_obj.seek(start_offset)
+                dest_file_obj.seek(dest_offset)
+                dest_file_obj.write(src_file_obj.read(end_offset - start_offset))
+
+    def _write_sizes_to_disk(self):
+        """Sets the RIFF and data chunk sizes in the header on disk, and in
+        meta_data_bytes, meta_data and the chunk index, to those of the sound data
+        and chunks actually in the file, adding the pad byte after an odd sized
+        data chunk if nothing follows it. RF64 files get the sizes in their ds64
+        chunk and keep the placeholders in the 32 bit fields.
+        """
+        data_chunk = self._find_chunk('data')
+        data_chunk_size = self.meta_data.data_chunk_size
+        header = bytearray(self.meta_data_bytes)
+        with open(self.filename, 'r+b') as wav_file_obj:
+            file_size = os.fstat(wav_file_obj.fileno()).st_size
+            if data_chunk_size % 2 and file_size == self._get_data_offset() + data_chunk_size:
+                wav_file_obj.seek(file_size)
+                wav_file_obj.write(b'\x00')
+                file_size += 1
+            super_chunk_size = file_size - WavChunk.HEADER_SIZE
+            ds64_chunk = self._find_chunk('ds64')
+            if ds64_chunk is not None and self.meta_data.super_chunk_id in (WavFileMetaData.SUPER_CHUNK_ID_RF64,
+                    WavFileMetaData.SUPER_CHUNK_ID_BW64):
+                struct.pack_into('<QQQ', header, ds64_chunk.get_data_offset() + WavFileMetaData.DS64_CHUNK_RIFF_SIZE_OFFSET,
+                        super_chunk_size, data_chunk_size, data_chunk_size // self._get_bytes_per_frame())
+            else:
+                # Sizes that do not fit in 32 bits are left as the placeholder, which readers take as to the end
+                struct.pack_into('<I', header, WavFileMetaData.SUPER_CHUNK_SIZE_OFFSET,
+                        min(super_chunk_size, WavFileMetaData.RF64_PLACEHOLDER_SIZE))
+                struct.pack_into('<I', header, data_chunk.offset + 4,
+                        min(data_chunk_size, WavFileMetaData.RF64_PLACEHOLDER_SIZE))
+            wav_file_obj.seek(0)
+            wav_file_obj.write(header)
+        self.meta_data_bytes = bytes(header)
+        self.meta_data.super_chunk_size = super_chunk_size
+        data_chunk.size = data_chunk_size
 
     def _read_meta_data_from_disk(self):
         with open(self.filename, 'rb') as wav_file_obj:
-            # Meta data bytes is used in applying transformations as the meta data bytes are copied
-            self.meta_data_bytes = wav_file_obj.read(WavFileMetaData.NUM_BYTES_BEFORE_DATA_STARTS)
+            self.chunks = self._read_chunk_index(wav_file_obj)
+            data_chunk = self._find_chunk('data')
+            # Meta data bytes is used in applying transformations as the meta data bytes are copied,
+            #   they hold everything up to where the sound data starts
+            num_meta_data_bytes = data_chunk.get_data_offset() if data_chunk is not None else \
+                    WavFileMetaData.NUM_BYTES_BEFORE_DATA_STARTS
+            wav_file_obj.seek(0)
+            self.meta_data_bytes = wav_file_obj.read(num_meta_data_bytes)
         self.meta_data = self._parse_meta_data(self.meta_data_bytes)
         is_meta_data_valid, err_str = self._validate_meta_data()
         assert is_meta_data_valid, err_str
 
+    @classmethod
+    def _read_chunk_index(cls, wav_file_obj):
+        """Walks the chunks that follow the RIFF header and returns a list with a
+        WavChunk for each of them. Only the 8 byte chunk headers are read.
+        """
+        file_size = os.fstat(wav_file_obj.fileno()).st_size
+        wav_file_obj.seek(WavFileMetaData.SUPER_CHUNK_SIZE_OFFSET)
+        super_chunk_size_bytes = wav_file_obj.read(4)
+        if len(super_chunk_size_bytes) < 4:
+            return []
+        super_chunk_size = struct.unpack('<I', super_chunk_size_bytes)[0]
+        end_offset = min(file_size, WavFileMetaData.SUPER_CHUNK_FORMAT_OFFSET + super_chunk_size)
+        is_super_chunk_size_unset = super_chunk_size in (0, 0xFFFFFFFF)
+        if is_super_chunk_size_unset:
+            # Size was never filled in by the program writing the file
+            end_offset = file_size
+        chunks = []
+        # 64 bit chunk sizes by chunk id from the ds64 chunk of RF64 files
+        rf64_chunk_sizes = {}
+        offset = WavFileMetaData.FORMAT_CHUNK_ID_OFFSET
+        while offset + WavChunk.HEADER_SIZE <= end_offset:
+            wav_file_obj.seek(offset)
+            chunk_id, chunk_size = struct.unpack('<4sI', wav_file_obj.read(WavChunk.HEADER_SIZE))
+            if chunk_id == b'ds64':
+                rf64_chunk_sizes = cls._read_ds64_chunk_sizes(wav_file_obj.read(chunk_size))
+            elif chunk_size == WavFileMetaData.RF64_PLACEHOLDER_SIZE and chunk_id in rf64_chunk_sizes:
+                chunk_size = rf64_chunk_sizes[chunk_id]
+            elif chunk_id == b'data' and chunk_size == 0 and \
+                    (is_super_chunk_size_unset or offset + WavChunk.HEADER_SIZE >= end_offset):
+                # A recording in progress whose sizes are still 0, its sound data runs to the end of the file
+                chunk_size = file_size - offset - WavChunk.HEADER_SIZE
+            # Never let a chunk run past the end of the file, e.g. a recording that was cut short
+            chunk_size = min(chunk_size, file_size - offset - WavChunk.HEADER_SIZE)
+            chunk = WavChunk(chunk_id.decode('latin-1'), offset, chunk_size)
+            chunks.append(chunk)
+            offset = chunk.get_end_offset()
+        return chunks
+
+    @classmethod
+    def _read_ds64_chunk_sizes(cls, ds64_bytes):
+        """Returns a dict from chunk id to 64 bit chunk size with the size of the
+        data chunk and every entry of the table in an RF64 ds64 chunk payload.
+        """
+        if len(ds64_bytes) < WavFileMetaData.DS64_CHUNK_SIZE:
+            return {}
+        chunk_sizes = {b'data': struct.unpack_from('<Q', ds64_bytes, WavFileMetaData.DS64_CHUNK_DATA_SIZE_OFFSET)[0]}
+        table_length = struct.unpack_from('<I', ds64_bytes, WavFileMetaData.DS64_CHUNK_TABLE_LENGTH_OFFSET)[0]
+        for table_index in range(table_length):
+            table_entry_offset = WavFileMetaData.DS64_CHUNK_TABLE_OFFSET + table_index * 12
+            if table_entry_offset + 12 > len(ds64_bytes):
+                break
+            chunk_id, chunk_size = struct.unpack_from('<4sQ', ds64_bytes, table_entry_offset)
+            chunk_sizes[chunk_id] = chunk_size
+        return chunk_sizes
+
+    def _find_chunk(self, chunk_id):
+        """Returns the first WavChunk in the chunk index with chunk_id or None.
+        """
+        for chunk in self.chunks or []:
+            if chunk.chunk_id == chunk_id:
+                return chunk
+        return None
+
+    def _get_data_offset(self):
+        """Returns the offset from the start of the file where the sound data starts,
+        which is right after the meta data bytes.
+        """
+        return len(self.meta_data_bytes)
+
+
+    @classmethod
+    def _transform_data_in_parallel(cls, src_wav_file, dest_wav_file, block_trans_func, workers, metrics=None):
+        """Splits the data chunk of src_wav_file into frame aligned segments that
+        worker processes transform and write straight to their offset in the
+        preallocated dest_wav_file, so the output is the same as the serial path.
+        Each worker fills in its own metrics which are merged into metrics.
+        """
+        data_offset = len(dest_wav_file.meta_data_bytes)
+        os.truncate(dest_wav_file.filename, data_offset + src_wav_file.meta_data.data_chunk_size)
+        num_frames = src_wav_file._get_num_frames()
+        segment_starts = [num_frames * worker_index // workers for worker_index in range(workers)]
+        # The last segment also picks up the bytes of a trailing partial frame
+        segment_ends = segment_starts[1:] + [None]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_transform_data_segment, src_wav_file, dest_wav_file.filename, data_offset,
+                    start_frame, end_frame, block_trans_func, metrics is not None)
+                    for start_frame, end_frame in zip(segment_starts, segment_ends)]
+            for future in futures:
+                segment_metrics = future.result()
+                if metrics is not None:
+                    metrics.merge(segment_metrics)
+
+    def _transform_block(self, frame_index, data, block_trans_func, metrics=None):
+        """Returns the raw bytes of a block of the data chunk after decoding them,
+        applying block_trans_func and encoding them again.
+        """
+        bits_per_sample = self.meta_data.format_chunk_bits_per_sample
+        if metrics is not None:
+            metrics.num_samples += len(data) // (bits_per_sample // 8)
+        if block_trans_func is None:
+            return data
+        num_channels = self.meta_data.format_chunk_num_channels
+        with time_stage(metrics, 'decode'):
+            frames = pcm.decode_frames(data, num_channels, bits_per_sample)
+        with time_stage(metrics, 'transform'):
+            frames = block_trans_func(frame_index, frames)
+        with time_stage(metrics, 'encode'):
+            num_frame_bytes = len(data) // self._get_bytes_per_frame() * self._get_bytes_per_frame()
+            # Bytes of a trailing partial frame are copied over as is
+            data = pcm.encode_frames(frames, bits_per_sample) + data[num_frame_bytes:]
+        return data
+
+    def _get_bytes_per_frame(self):
+        return self.meta_data.format_chunk_num_channels * self.meta_data.format_chunk_bits_per_sample // 8
+
+    def _get_num_frames(self):
+        return self.meta_data.data_chunk_size // self._get_bytes_per_frame()
+
+    def _iter_data_blocks(self, start_frame=0, end_frame=None, metrics=None):
+        """Generator that streams the data chunk from disk and yields tuples of
+        frame_index: int, the index of the first frame in the block, and the raw
+        bytes of the block. Every block but the last is _get_read_block_size() bytes.
+        Only the frames from start_frame up to end_frame are read, or up to the end
+        of the data chunk if end_frame is None. The reads are timed into metrics if
+        it is given.
+        """
+        bytes_per_block = self._get_read_block_size()
+        bytes_per_frame = self._get_bytes_per_frame()
+        if end_frame is None:
+            bytes_left = self.meta_data.data_chunk_size - start_frame * bytes_per_frame
+        else:
+            bytes_left = (end_frame - start_frame) * bytes_per_frame
+        frame_index = start_frame
+        with open(self.filename, 'rb') as wav_file_obj:
+            wav_file_obj.seek(self._get_data_offset() + start_frame * bytes_per_frame)
+            while bytes_left > 0:
+                with time_stage(metrics, 'read'):
+                    data = wav_file_obj.read(min(bytes_per_block, bytes_left))
+                if metrics is not None:
+                    metrics.num_bytes_read += len(data)
+                if not data:
+                    break
+                yield frame_index, data
+                bytes_left -= len(data)
+                frame_index += len(data) // bytes_per_frame
+
     def _validate_meta_data(self):
         """Returns bool, str combo. The string is the error(s)
             that occured or None if no errors. The bool is true on no errors but
@@ -222,7 +830,8 @@ class WavFile:
         """
         success = True
         errors = []
-        if self.meta_data.super_chunk_id != WavFileMetaData.SUPER_CHUNK_ID_EXPECTED:
+        if self.meta_data.super_chunk_id not in (WavFileMetaData.SUPER_CHUNK_ID_EXPECTED,
+                WavFileMetaData.SUPER_CHUNK_ID_RF64, WavFileMetaData.SUPER_CHUNK_ID_BW64):
             success = False
             errors.append("super_chunk_id | actual = %d expected = %d" %
                     (self.meta_data.super_chunk_id, WavFileMetaData.SUPER_CHUNK_ID_EXPECTED))
@@ -234,23 +843,36 @@ class WavFile:
             success = False
             errors.append("format_chunk_id | actual = %d expected = %d" %
                     (self.meta_data.format_chunk_id, WavFileMetaData.FORMAT_CHUNK_ID_EXPECTED))
-        if self.meta_data.format_chunk_size != WavFileMetaData.FORMAT_CHUNK_SIZE_EXPECTED:
+        if self.meta_data.format_chunk_size < WavFileMetaData.FORMAT_CHUNK_SIZE_EXPECTED:
             success = False
-            errors.append("format_chunk_size | actual = %d expected = %d" %
+            errors.append("format_chunk_size | actual = %d expected = at least %d" %
                     (self.meta_data.format_chunk_size, WavFileMetaData.FORMAT_CHUNK_SIZE_EXPECTED))
-        if self.meta_data.format_chunk_audio_format != WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_EXPECTED:
+        if self.meta_data.is_extensible():
+            if self.meta_data.format_chunk_sub_format != WavFileMetaData.FORMAT_CHUNK_SUB_FORMAT_PCM:
+                success = False
+                errors.append("format_chunk_sub_format | actual = %s expected = %s" %
+                        (self.meta_data.format_chunk_sub_format.hex(), WavFileMetaData.FORMAT_CHUNK_SUB_FORMAT_PCM.hex()))
+        elif self.meta_data.format_chunk_audio_format != WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_EXPECTED:
             success = False
             errors.append("format_chunk_audio_format | actual = %d expected = %d" %
                     (self.meta_data.format_chunk_audio_format, WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_EXPECTED))
-        if self.meta_data.format_chunk_num_channels != WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED:
+        if self.meta_data.format_chunk_num_channels < 1:
+            success = False
+            errors.append("format_chunk_num_channels | actual = %s expected = at least 1" %
+                    self.meta_data.format_chunk_num_channels)
+        if self.meta_data.format_chunk_sample_rate < 1:
             success = False
-            errors.append("format_chunk_num_channels | actual = %s expected = %d" %
-                    (self.meta_data.format_chunk_num_channels, WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED))
+            errors.append("format_chunk_sample_rate | actual = %s expected = at least 1" %
+                    self.meta_data.format_chunk_sample_rate)
         if self.meta_data.data_chunk_id != WavFileMetaData.DATA_CHUNK_ID_EXPECTED:
             success = False
             errors.append("data_chunk_id | actual = %d expected = %d" %
                     (self.meta_data.data_chunk_id, WavFileMetaData.DATA_CHUNK_ID_EXPECTED))
-        if self.meta_data.format_chunk_bits_per_sample % 8 != 0:
+        if self.meta_data.format_chunk_bits_per_sample < 1:
+            success = False
+            errors.append("format_chunk_bits_per_sample | actual = %s expected = at least 1" %
+                    self.meta_data.format_chunk_bits_per_sample)
+        elif self.meta_data.format_chunk_bits_per_sample % 8 != 0:
             success = False
             errors.append("format_chunk_bits_per_sample | actual: Not divisble by 8 expected: divisible by 8")
         err_str = "Wav file metadata errors:\n  " + '\n  '.join(errors) if errors else None
@@ -258,6 +880,8 @@ class WavFile:
 
     def _parse_meta_data(self, meta_data_bytes):
         """Helpers used in ctor that creates the WavFileMetaData object used by WavFile class.
+        The fmt and data chunk fields are read from wherever the chunk index says
+        those chunks are, so they are left as 0 if either chunk is missing.
         """
         meta_data = WavFileMetaData()
         meta_data.super_chunk_id = struct.unpack_from('>I',
@@ -266,27 +890,53 @@ class WavFile:
                 meta_data_bytes[WavFileMetaData.SUPER_CHUNK_SIZE_OFFSET:WavFileMetaData.SUPER_CHUNK_FORMAT_OFFSET + 4])[0]
         meta_data.super_chunk_format = struct.unpack_from('>I',
                 meta_data_bytes[WavFileMetaData.SUPER_CHUNK_FORMAT_OFFSET:WavFileMetaData.FORMAT_CHUNK_ID_OFFSET + 4])[0]
-        meta_data.format_chunk_id = struct.unpack_from('>I',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_ID_OFFSET:WavFileMetaData.FORMAT_CHUNK_ID_OFFSET + 4])[0]
-
-        meta_data.format_chunk_size = struct.unpack_from('<I',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_SIZE_OFFSET:WavFileMetaData.FORMAT_CHUNK_SIZE_OFFSET + 4])[0]
-        meta_data.format_chunk_audio_format = struct.unpack_from('<H',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_OFFSET:WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_OFFSET + 2])[0]
-        meta_data.format_chunk_num_channels = struct.unpack_from('<H',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_OFFSET:WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_OFFSET + 2])[0]
-        meta_data.format_chunk_sample_rate = struct.unpack_from('<I',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_SAMPLE_RATE_OFFSET:WavFileMetaData.FORMAT_CHUNK_SAMPLE_RATE_OFFSET + 4])[0]
-        meta_data.format_chunk_byte_rate = struct.unpack_from('<I',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_BYTE_RATE_OFFSET:WavFileMetaData.FORMAT_CHUNK_BYTE_RATE_OFFSET + 4])[0]
-        meta_data.format_chunk_block_align = struct.unpack_from('<H',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_BLOCK_ALIGN_OFFSET:WavFileMetaData.FORMAT_CHUNK_BLOCK_ALIGN_OFFSET + 2])[0]
-        meta_data.format_chunk_bits_per_sample = struct.unpack_from('<H',
-                meta_data_bytes[WavFileMetaData.FORMAT_CHUNK_BITS_PER_SAMPLE_OFFSET:WavFileMetaData.FORMAT_CHUNK_BITS_PER_SAMPLE_OFFSET + 2])[0]
-        meta_data.data_chunk_id = struct.unpack_from('>I',
-                meta_data_bytes[WavFileMetaData.DATA_CHUNK_ID_OFFSET:WavFileMetaData.DATA_CHUNK_ID_OFFSET + 4])[0]
-        meta_data.data_chunk_size = struct.unpack_from('<I',
-                meta_data_bytes[WavFileMetaData.DATA_CHUNK_SIZE_OFFSET:WavFileMetaData.DATA_CHUNK_SIZE_OFFSET + 4])[0]
+        fmt_chunk = self._find_chunk('fmt ')
+        if fmt_chunk is not None:
+            # Offsets of the fmt chunk fields are relative to where it is in a canonical 44 byte header
+            fmt_shift = fmt_chunk.offset - WavFileMetaData.FORMAT_CHUNK_ID_OFFSET
+            meta_data.format_chunk_id = struct.unpack_from('>I',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_ID_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_ID_OFFSET + 4])[0]
+            meta_data.format_chunk_size = struct.unpack_from('<I',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_SIZE_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_SIZE_OFFSET + 4])[0]
+            meta_data.format_chunk_audio_format = struct.unpack_from('<H',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_AUDIO_FORMAT_OFFSET + 2])[0]
+            meta_data.format_chunk_num_channels = struct.unpack_from('<H',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_OFFSET + 2])[0]
+            meta_data.format_chunk_sample_rate = struct.unpack_from('<I',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_SAMPLE_RATE_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_SAMPLE_RATE_OFFSET + 4])[0]
+            meta_data.format_chunk_byte_rate = struct.unpack_from('<I',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_BYTE_RATE_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_BYTE_RATE_OFFSET + 4])[0]
+            meta_data.format_chunk_block_align = struct.unpack_from('<H',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_BLOCK_ALIGN_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_BLOCK_ALIGN_OFFSET + 2])[0]
+            meta_data.format_chunk_bits_per_sample = struct.unpack_from('<H',
+                    meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_BITS_PER_SAMPLE_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_BITS_PER_SAMPLE_OFFSET + 2])[0]
+            if meta_data.format_chunk_size >= 18:
+                meta_data.format_chunk_extension_size = struct.unpack_from('<H',
+                        meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_EXTENSION_SIZE_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_EXTENSION_SIZE_OFFSET + 2])[0]
+            if meta_data.is_extensible() and meta_data.format_chunk_size >= WavFileMetaData.FORMAT_CHUNK_EXTENSIBLE_SIZE:
+                meta_data.format_chunk_valid_bits_per_sample = struct.unpack_from('<H',
+                        meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_VALID_BITS_PER_SAMPLE_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_VALID_BITS_PER_SAMPLE_OFFSET + 2])[0]
+                meta_data.format_chunk_channel_mask = struct.unpack_from('<I',
+                        meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_CHANNEL_MASK_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_CHANNEL_MASK_OFFSET + 4])[0]
+                meta_data.format_chunk_sub_format = bytes(
+                        meta_data_bytes[fmt_shift + WavFileMetaData.FORMAT_CHUNK_SUB_FORMAT_OFFSET:fmt_shift + WavFileMetaData.FORMAT_CHUNK_SUB_FORMAT_OFFSET + 16])
+        data_chunk = self._find_chunk('data')
+        if data_chunk is not None:
+            data_shift = data_chunk.offset - WavFileMetaData.DATA_CHUNK_ID_OFFSET
+            meta_data.data_chunk_id = struct.unpack_from('>I',
+                    meta_data_bytes[data_shift + WavFileMetaData.DATA_CHUNK_ID_OFFSET:data_shift + WavFileMetaData.DATA_CHUNK_ID_OFFSET + 4])[0]
+            meta_data.data_chunk_size = struct.unpack_from('<I',
+                    meta_data_bytes[data_shift + WavFileMetaData.DATA_CHUNK_SIZE_OFFSET:data_shift + WavFileMetaData.DATA_CHUNK_SIZE_OFFSET + 4])[0]
+            if meta_data.data_chunk_size in (0, WavFileMetaData.RF64_PLACEHOLDER_SIZE):
+                # Not filled in yet, the chunk index has the size to the end of the file if it is a recording
+                #   in progress and 0 otherwise
+                meta_data.data_chunk_size = data_chunk.size
+            # The chunk index has the size clamped to what is actually on disk
+            meta_data.data_chunk_size = min(meta_data.data_chunk_size, data_chunk.size)
+        ds64_chunk = self._find_chunk('ds64')
+        if ds64_chunk is not None and meta_data.super_chunk_size == WavFileMetaData.RF64_PLACEHOLDER_SIZE:
+            meta_data.super_chunk_size = struct.unpack_from('<Q', meta_data_bytes,
+                    ds64_chunk.get_data_offset() + WavFileMetaData.DS64_CHUNK_RIFF_SIZE_OFFSET)[0]
         return meta_data
 
     def _get_read_block_size(self):
@@ -294,26 +944,224 @@ class WavFile:
         the wav file which is based on some of the metadata so that we do not
         unalign with the samples.
         """
-        return WavFile.SAMPLES_PER_BLOCK * self.meta_data.format_chunk_num_channels * self.meta_data.format_chunk_bits_per_sample // 8
+        return WavFile.SAMPLES_PER_BLOCK * self._get_bytes_per_frame()
+
+
+def _to_dbfs(level, full_scale):
+    """Returns level relative to full_scale in dB, or None for silence because
+    JSON has no -infinity.
+    """
+    return 20 * math.log10(level / full_scale) if level > 0 else None
+
+
+def _transform_data_segment(src_wav_file, dest_filename, dest_data_offset, start_frame, end_frame, block_trans_func,
+        collect_metrics=False):
+    """Worker process entry point of WavFile._transform_data_in_parallel that
+    transforms the frames from start_frame to end_frame and writes them in place.
+    Returns the ProcessingMetrics of the segment if collect_metrics is True.
+    """
+    metrics = ProcessingMetrics() if collect_metrics else None
+    bytes_per_frame = src_wav_file._get_bytes_per_frame()
+    dest_fd = os.open(dest_filename, os.O_WRONLY)
+    try:
+        for frame_index, data in src_wav_file._iter_data_blocks(start_frame, end_frame, metrics):
+            data = src_wav_file._transform_block(frame_index, data, block_trans_func, metrics)
+            with time_stage(metrics, 'write'):
+                os.pwrite(dest_fd, data, dest_data_offset + frame_index * bytes_per_frame)
+            if metrics is not None:
+                metrics.num_bytes_written += len(data)
+                metrics.end_block()
+    finally:
+        os.close(dest_fd)
+    return metrics
+
+
+class WavFrames:
+    """A lazily decoded frames x channels view of the data chunk of a wav file
+    backed by a read only memory map, so indexing only touches the pages of the
+    file that hold the selected frames. Indexing works like a 2d numpy array,
+    e.g. frames[1000:2000], frames[::2, 0] or frames[-10:, [0, 1]], and returns
+    an int32 numpy array of signed sample values.
+
+    """
+
+    def __init__(self, wav_file):
+        self.sample_rate = wav_file.meta_data.format_chunk_sample_rate
+        self.num_channels = wav_file.meta_data.format_chunk_num_channels
+        self.bits_per_sample = wav_file.meta_data.format_chunk_bits_per_sample
+        bytes_per_sample = self.bits_per_sample // 8
+        num_frames = wav_file.meta_data.data_chunk_size // (bytes_per_sample * self.num_channels)
+        with open(wav_file.filename, 'rb') as wav_file_obj:
+            # The memory map stays valid after the file object is closed
+            self._mmap = mmap.mmap(wav_file_obj.fileno(), 0, access=mmap.ACCESS_READ)
+        data_offset = wav_file._get_data_offset()
+        num_frames = min(num_frames, (len(self._mmap) - data_offset) // (bytes_per_sample * self.num_channels))
+        # Zero copy view of the raw sample bytes, the last axis holds the bytes of one sample
+        self._raw = np.ndarray((num_frames, self.num_channels, bytes_per_sample), dtype=np.uint8,
+                buffer=self._mmap, offset=data_offset)
+
+    def __len__(self):
+        return self._raw.shape[0]
+
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        ellipsis_positions = [position for position, index in enumerate(key) if index is Ellipsis]
+        assert len(ellipsis_positions) <= 1, "Frames can only be indexed with one ellipsis"
+        if ellipsis_positions:
+            # Expanded here so it only covers the frame and channel axes and never the hidden axis of sample bytes
+            position = ellipsis_positions[0]
+            key = key[:position] + (slice(None),) * (3 - len(key)) + key[position + 1:]
+        assert len(key) <= 2, "Frames can only be indexed by frame and channel"
+        return pcm.decode_samples(self._raw[key], self.bits_per_sample)
+
+    @property
+    def shape(self):
+        return self._raw.shape[:2]
+
+    def time_slice(self, start_seconds, end_seconds=None, channels=slice(None)):
+        """Returns the frames between start_seconds and end_seconds, or the end
+        of the file if end_seconds is None, for the selected channels.
+        """
+        start_frame = int(start_seconds * self.sample_rate)
+        end_frame = None if end_seconds is None else int(end_seconds * self.sample_rate)
+        return self[start_frame:end_frame, channels]
+
+    def close(self):
+        # The numpy view has to be released before the memory map can be closed
+        self._raw = None
+        self._mmap.close()
+
+
+def _read_frames_block(fd, offset, num_bytes, num_channels, bits_per_sample):
+    """Executor entry point of WavFile.aiter_blocks that reads and decodes one
+    block. pread is used so blocks can be read by many threads at once.
+    """
+    return pcm.decode_frames(os.pread(fd, num_bytes, offset), num_channels, bits_per_sample)
+
+
+def _write_frames_block(fd, offset, frames, bits_per_sample):
+    """Executor entry point of AsyncWavWriter.write that encodes and writes one
+    block at its offset in the file.
+    """
+    os.pwrite(fd, pcm.encode_frames(frames, bits_per_sample), offset)
+
+
+async def _wait_for_executor_futures(futures):
+    """Waits until every one of futures, which come from run_in_executor, has
+    finished, even if the waiting task is cancelled meanwhile, because cancelling
+    them would not stop a call that is already running in its thread. Their
+    exceptions are dropped, and a cancellation is raised again once they are
+    all done.
+    """
+    futures = list(futures)
+    is_cancelled = False
+    while not all(future.done() for future in futures):
+        try:
+            await asyncio.wait(futures)
+        except asyncio.CancelledError:
+            is_cancelled = True
+    for future in futures:
+        if not future.cancelled():
+            future.exception()
+    if is_cancelled:
+        raise asyncio.CancelledError()
+
+
+class AsyncWavWriter:
+    """Writes a PCM wav file of the given format from blocks of frames without
+    blocking the event loop, e.g.
+
+        async with AsyncWavWriter('out.wav', 48000, 24, 2) as writer:
+            async for frame_index, frames in wav_file.aiter_blocks():
+                await writer.write(frames)
+
+    Encoding and writing run on executor, or the default executor of the loop
+    if it is None, with up to write_behind blocks in flight so the caller can
+    produce the next block meanwhile. The header gets the real sizes on close.
+
+    """
+
+    def __init__(self, filename, sample_rate=WavFileMetaData.FORMAT_CHUNK_SAMPLE_RATE_DEFAULT,
+            bits_per_sample=WavFileMetaData.BYTES_PER_SAMPLE_DEFAULT * 8,
+            num_channels=WavFileMetaData.FORMAT_CHUNK_NUM_CHANNELS_EXPECTED, write_behind=2, executor=None):
+        self.wav_file = WavFile(filename)
+        self.wav_file.meta_data = WavFileMetaData.make_default(sample_rate, bits_per_sample, num_channels, None)
+        self.wav_file.meta_data_bytes = self.wav_file.meta_data.get_bytes()
+        self.write_behind = write_behind
+        self.executor = executor
+        self.num_data_bytes = 0
+        self._fd = None
+        self._pending = collections.deque()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def open(self):
+        """Creates the file and writes a header that is patched on close.
+        """
+        loop = asyncio.get_running_loop()
+        self._fd = await loop.run_in_executor(self.executor, os.open, self.wav_file.filename,
+                os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        await loop.run_in_executor(self.executor, os.pwrite, self._fd, self.wav_file.meta_data_bytes, 0)
 
-    def _get_per_sample_struct_format_str_and_padding(self):
-        """Returns the string that should be used as the first argument to
-        struct.unpack_from because this will differ depending on the number of
-        bits per sample as well as the padding of 0's bytes that is required for
-        the pack to work.
+    async def write(self, frames):
+        """Queues a frames x channels integer array to be appended to the data
+        chunk, waiting first if write_behind blocks are already in flight.
+        Values outside of the range of the bit depth are clipped. frames is
+        encoded in the background so it must not be changed afterwards.
+        """
+        assert self._fd is not None, "AsyncWavWriter has to be opened before writing"
+        while len(self._pending) >= max(self.write_behind, 1):
+            await asyncio.shield(self._pending[0])
+            self._pending.popleft()
+        offset = self.wav_file._get_data_offset() + self.num_data_bytes
+        self.num_data_bytes += len(frames) * self.wav_file._get_bytes_per_frame()
+        self._pending.append(asyncio.get_running_loop().run_in_executor(self.executor, _write_frames_block,
+                self._fd, offset, frames, self.wav_file.meta_data.format_chunk_bits_per_sample))
 
+    async def close(self):
+        """Waits for the queued blocks, writes the header with the real sizes and
+        closes the file. Returns the WavFile that was written.
         """
-        bytes_per_sample = self.meta_data.format_chunk_bits_per_sample // 8
-        if bytes_per_sample == 1:
-            fmt = '<c'
-            padding = bytearray(0)
-        if bytes_per_sample == 2:
-            fmt = '<H'
-            padding = bytearray(0)
-        if bytes_per_sample <= 4:
-            fmt = '<I'
-            padding = bytearray(4 - bytes_per_sample)
-        else: # bytes_per_sample > 4
-            fmt = bytearray(8 - bytes_per_sample)
-            padding = bytearray(8 - bytes_per_sample)
-        return fmt, padding
+        if self._fd is None:
+            return self.wav_file
+        loop = asyncio.get_running_loop()
+        try:
+            while self._pending:
+                await asyncio.shield(self._pending[0])
+                self._pending.popleft()
+            meta_data = self.wav_file.meta_data
+            meta_data.set_data_chunk_size(self.num_data_bytes)
+            self.wav_file.meta_data_bytes = meta_data.get_bytes()
+            await loop.run_in_executor(self.executor, os.pwrite, self._fd, self.wav_file.meta_data_bytes, 0)
+            if self.num_data_bytes % 2:
+                await loop.run_in_executor(self.executor, os.pwrite, self._fd, b'\x00',
+                        self.wav_file._get_data_offset() + self.num_data_bytes)
+        finally:
+            await _wait_for_executor_futures(self._pending)
+            self._pending.clear()
+            os.close(self._fd)
+            self._fd = None
+        return self.wav_file
+
+
+class PerSampleTransformation:
+    """Adapts a per sample trans_func that accepts channel_index: int and
+    sample_value: int to the block transformation interface used by
+    WavFile.create_new_wav_file_with_transformation.
+
+    """
+
+    def __init__(self, trans_func):
+        self.trans_func = trans_func
+
+    def __call__(self, frame_index, frames):
+        out_frames = np.empty(frames.shape, dtype=np.int64)
+        for channel_index in range(frames.shape[1]):
+            channel_trans_func = np.frompyfunc(lambda sample_value: self.trans_func(channel_index, sample_value), 1, 1)
+            out_frames[:, channel_index] = channel_trans_func(frames[:, channel_index].tolist())
+        return out_frames
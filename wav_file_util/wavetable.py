@@ -0,0 +1,94 @@
+"""Module that contains the band limited wavetable oscillator used to generate
+wave forms with table lookups instead of evaluating them for every sample.
+
+"""
+
+import math
+import functools
+
+import numpy as np
+
+
+# Number of samples in one period of every table
+TABLE_SIZE = 4096
+
+
+def get_sine_harmonics(num_harmonics):
+    return {1: 1.0}
+
+
+def get_square_harmonics(num_harmonics):
+    # Square wave that is 1 for the first half of the period and -1 for the second
+    return {k: 4 / (math.pi * k) for k in range(1, num_harmonics + 1, 2)}
+
+
+def get_sawtooth_harmonics(num_harmonics):
+    # Sawtooth that rises from -1 to 1 over the period
+    return {k: -2 / (math.pi * k) for k in range(1, num_harmonics + 1)}
+
+
+# name: function that returns {harmonic number: amplitude of its sine} for up to num_harmonics harmonics
+harmonics_by_wavetable_name = {
+    'sine': get_sine_harmonics,
+    'square': get_square_harmonics,
+    'sawtooth': get_sawtooth_harmonics
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_wavetables(wavetable_name, sample_rate):
+    """Returns a (max_frequencies, tables) tuple for the named wave form at
+    sample_rate, which is built the first time it is asked for and cached after.
+    tables has one row per octave and row i only holds the harmonics that stay
+    below the Nyquist frequency for fundamentals up to max_frequencies[i], so
+    playing it back does not alias. Every row has one extra sample that wraps
+    around to the start to make interpolation simpler.
+    """
+    get_harmonics = harmonics_by_wavetable_name[wavetable_name]
+    nyquist_frequency = sample_rate / 2
+    # Below this frequency the table can not hold every harmonic up to Nyquist anyway
+    max_frequency = sample_rate / TABLE_SIZE
+    max_frequencies = []
+    tables = []
+    while True:
+        num_harmonics = min(int(nyquist_frequency // max_frequency), TABLE_SIZE // 2 - 1)
+        harmonics = get_harmonics(max(num_harmonics, 1))
+        spectrum = np.zeros(TABLE_SIZE // 2 + 1, dtype=np.complex128)
+        for harmonic_number, amplitude in harmonics.items():
+            spectrum[harmonic_number] = -0.5j * amplitude * TABLE_SIZE
+        table = np.fft.irfft(spectrum, TABLE_SIZE)
+        # Keep within [-1, 1] despite the overshoot of band limited edges
+        table /= max(np.abs(table).max(), 1.0)
+        max_frequencies.append(max_frequency)
+        tables.append(np.append(table, table[0]))
+        if num_harmonics <= 1 or len(harmonics) == 1:
+            break
+        max_frequency *= 2
+    # The last table is used for every frequency above the others
+    max_frequencies[-1] = math.inf
+    return np.array(max_frequencies), np.array(tables)
+
+
+class WavetableOscillator:
+    """Plays back the cached band limited tables of a wave form at a sample rate.
+
+    """
+
+    def __init__(self, wavetable_name, sample_rate):
+        self.max_frequencies, self.tables = get_wavetables(wavetable_name, sample_rate)
+
+    def lookup(self, phases, frequencies):
+        """Returns the values in [-1, 1] of the wave form at phases, measured in
+        periods so only their fractional part matters, by linearly interpolating
+        between table samples. frequencies is the frequency at every phase, or
+        one frequency for all of them, and picks the table that does not alias.
+        """
+        table_indexes = np.searchsorted(self.max_frequencies, np.abs(frequencies))
+        positions = (phases % 1.0) * TABLE_SIZE
+        sample_indexes = positions.astype(np.int64)
+        # Phases just below 1 can round up to TABLE_SIZE
+        sample_indexes = np.minimum(sample_indexes, TABLE_SIZE - 1)
+        fractions = positions - sample_indexes
+        start_values = self.tables[table_indexes, sample_indexes]
+        end_values = self.tables[table_indexes, sample_indexes + 1]
+        return start_values + (end_values - start_values) * fractions